@@ -0,0 +1,177 @@
+import time
+from collections import deque
+
+import pygame
+
+# Задержка автоповтора (DAS), период автоповтора (ARR) и период ускоренного падения, мс
+DAS_MS = 170
+ARR_MS = 50
+SOFT_DROP_MS = 50
+
+LEFT = "left"
+RIGHT = "right"
+DOWN = "down"
+ROTATE = "rotate"
+HARD_DROP = "hard_drop"
+PAUSE = "pause"
+
+DEFAULT_KEYMAP = {
+    pygame.K_LEFT: LEFT,
+    pygame.K_RIGHT: RIGHT,
+    pygame.K_DOWN: DOWN,
+    pygame.K_UP: ROTATE,
+    pygame.K_RETURN: HARD_DROP,
+    pygame.K_SPACE: PAUSE
+}
+
+
+def now_ms():
+    return time.perf_counter() * 1000
+
+
+# Задержка от нажатия до показа кадра с результатом (key-to-photon)
+class LatencyStats:
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def summary(self):
+        if not self.samples:
+            return None
+        values = sorted(self.samples)
+        return {
+            "count": len(values),
+            "p50": values[len(values) // 2],
+            "p99": values[min(len(values) - 1, len(values) * 99 // 100)],
+            "max": values[-1]
+        }
+
+
+# События клавиш получают метку времени при опросе. Повторы сдвига и ускоренного падения
+# планируются на точные моменты времени (нажатие + DAS + k * ARR), а не раз в кадр,
+# поэтому за долгий кадр выполняются все пропущенные повторы в правильном порядке.
+# clock задает время повторов: в игре это часы симуляции, тогда повторы идут между шагами
+# гравитации и учитывают скорость симуляции. Задержка до кадра всегда меряется по wall_clock.
+class InputHandler:
+    def __init__(self, das=DAS_MS, arr=ARR_MS, soft_drop=SOFT_DROP_MS, keymap=None, clock=now_ms,
+                 wall_clock=now_ms):
+        self.das = das
+        self.arr = arr
+        self.soft_drop = soft_drop
+        self.keymap = keymap or DEFAULT_KEYMAP
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.events = deque()
+        self.held = set()
+        self.direction = None
+        self.next_shift = None
+        # При ARR = 0 после DAS фигура прижимается к стенке, пока зажата клавиша
+        self.shift_to_wall = False
+        self.next_drop = None
+        self.frame_inputs = []
+        self.latency = LatencyStats()
+
+    @property
+    def soft_dropping(self):
+        return DOWN in self.held
+
+    def feed(self, event, timestamp=None):
+        if event.type not in (pygame.KEYDOWN, pygame.KEYUP):
+            return False
+        action = self.keymap.get(event.key)
+        if action is None:
+            return False
+        # Явная метка времени задает и время для замера задержки
+        wall_time = self.wall_clock() if timestamp is None else timestamp
+        timestamp = self.clock() if timestamp is None else timestamp
+        self.events.append((timestamp, action, event.type == pygame.KEYDOWN, wall_time))
+        return True
+
+    def update(self, game, now=None):
+        now = self.clock() if now is None else now
+        while True:
+            event_time = self.events[0][0] if self.events else None
+            candidates = [t for t in (event_time, self.next_shift, self.next_drop) if t is not None]
+            if not candidates:
+                break
+            t = min(candidates)
+            if t > now:
+                break
+            if t == event_time:
+                self.handle_event(game, *self.events.popleft())
+            elif t == self.next_shift:
+                self.repeat_shift(game, t)
+            else:
+                game.drop()
+                self.next_drop = t + self.soft_drop
+            if game.game_over:
+                self.next_shift = self.next_drop = None
+                self.shift_to_wall = False
+            elif self.shift_to_wall:
+                self.slide(game)
+        # На паузе повторы не копятся
+        if game.paused:
+            self.next_shift = now + self.das if self.direction else None
+            self.next_drop = now + self.soft_drop if self.soft_dropping else None
+            self.shift_to_wall = False
+        elif self.shift_to_wall and not game.game_over:
+            # Новая фигура или поворот между вызовами тоже прижимаются к стенке
+            self.slide(game)
+
+    def handle_event(self, game, timestamp, action, pressed, wall_time=None):
+        if not pressed:
+            self.held.discard(action)
+            if action == DOWN:
+                self.next_drop = None
+            elif action == self.direction:
+                # Если зажата другая сторона, сдвиг продолжается в нее с новой задержкой
+                other = RIGHT if action == LEFT else LEFT
+                self.direction = other if other in self.held else None
+                self.next_shift = timestamp + self.das if self.direction else None
+                self.shift_to_wall = False
+            return
+        if action in self.held:
+            return
+        self.held.add(action)
+        if action == PAUSE:
+            game.paused = not game.paused
+            return
+        if game.paused or game.game_over:
+            return
+        self.frame_inputs.append(timestamp if wall_time is None else wall_time)
+        if action in (LEFT, RIGHT):
+            self.direction = action
+            self.shift_to_wall = False
+            game.move(-1 if action == LEFT else 1, 0)
+            self.next_shift = timestamp + self.das
+        elif action == DOWN:
+            game.drop()
+            self.next_drop = timestamp + self.soft_drop
+        elif action == ROTATE:
+            game.rotate()
+        elif action == HARD_DROP:
+            game.hard_drop()
+
+    def repeat_shift(self, game, t):
+        if self.arr == 0:
+            # Мгновенный автоповтор: дальше фигура держится у стенки без повторов по времени
+            self.next_shift = None
+            self.shift_to_wall = True
+            self.slide(game)
+        else:
+            game.move(-1 if self.direction == LEFT else 1, 0)
+            self.next_shift = t + self.arr
+
+    def slide(self, game):
+        dx = -1 if self.direction == LEFT else 1
+        while game.move(dx, 0):
+            pass
+
+    # Вызывается сразу после display.flip: кадр с результатом нажатий уже на экране
+    def frame_presented(self, now=None):
+        now = self.wall_clock() if now is None else now
+        for timestamp in self.frame_inputs:
+            self.latency.add(now - timestamp)
+        self.frame_inputs.clear()
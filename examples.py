@@ -0,0 +1,284 @@
+import random
+import re
+
+CHUNK_SIZE = 1 << 16
+MAX_STORED_ERRORS = 100
+
+# Варианты записи операций, которые встречаются в файлах учителей
+OPERATOR_ALIASES = {
+    '×': '*', 'х': '*', 'x': '*', 'X': '*', '·': '*',
+    '÷': '/', ':': '/',
+    '−': '-', '–': '-', '—': '-'
+}
+ALIAS_TABLE = str.maketrans(OPERATOR_ALIASES)
+TOKEN = re.compile(r"\s*(?:(\d+)|([-+*/]))")
+ANSWER = re.compile(r"\s*([-+]?\d+)\s*")
+# Самый частый вид строки "a op b = c" разбирается одним регулярным выражением
+SIMPLE = re.compile(r"\s*(\d+)\s*([-+*/])\s*(\d+)\s*=\s*([-+]?\d+)\s*")
+
+
+class ExampleError(ValueError):
+    pass
+
+
+# Итог разбора файла: счетчики и первые MAX_STORED_ERRORS ошибок с номерами строк
+class ExampleReport:
+    def __init__(self):
+        self.lines = 0
+        self.blank = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.error_counts = {}
+        self.samples = []
+
+    def add_error(self, line_number, line, reason):
+        self.errors += 1
+        self.error_counts[reason] = self.error_counts.get(reason, 0) + 1
+        if len(self.samples) < MAX_STORED_ERRORS:
+            self.samples.append((line_number, line, reason))
+
+    def summary(self):
+        text = (f"Строк: {self.lines}, примеров: {self.accepted}, "
+                f"повторов: {self.duplicates}, ошибок: {self.errors}")
+        for reason, count in sorted(self.error_counts.items(), key=lambda item: -item[1]):
+            text += f"\n  {reason}: {count}"
+        for line_number, line, reason in self.samples[:10]:
+            text += f"\n  строка {line_number}: {line!r} ({reason})"
+        return text
+
+
+# Словарь пример -> ответ с индексом ответ -> примеры и списком всех примеров в порядке файла.
+# Пример под нужный ответ и случайный пример выбираются без обхода словаря: на файле в миллионы
+# строк обход стоил десятки миллисекунд на каждую фигуру. Заполняется присваиванием examples[пример] = ответ.
+class ExampleIndex(dict):
+    def __init__(self, examples=()):
+        super().__init__()
+        self.by_answer = {}
+        self.order = []
+        for example, answer in dict(examples).items():
+            self[example] = answer
+
+    def __setitem__(self, example, answer):
+        if example in self:
+            old = self[example]
+            if old == answer:
+                return
+            same = self.by_answer[old]
+            same.remove(example)
+            if not same:
+                del self.by_answer[old]
+        else:
+            self.order.append(example)
+        super().__setitem__(example, answer)
+        self.by_answer.setdefault(answer, []).append(example)
+
+    def with_answer(self, answer):
+        return self.by_answer.get(answer, ())
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match:
+            raise ExampleError("непонятный символ")
+        number, operator = match.groups()
+        tokens.append(int(number) if number is not None else operator)
+        position = match.end()
+    # Числа и операции должны чередоваться: a op b op c ...
+    if not tokens or len(tokens) % 2 == 0:
+        raise ExampleError("неполный пример")
+    for i, token in enumerate(tokens):
+        if isinstance(token, int) != (i % 2 == 0):
+            raise ExampleError("неполный пример")
+    return tokens
+
+
+# Вычисление без eval: сначала умножение и деление, затем сложение и вычитание
+def evaluate(tokens):
+    terms = [tokens[0]]
+    operators = []
+    for operator, number in zip(tokens[1::2], tokens[2::2]):
+        if operator == '*':
+            terms[-1] *= number
+        elif operator == '/':
+            if number == 0 or terms[-1] % number:
+                raise ExampleError("деление не нацело")
+            terms[-1] //= number
+        else:
+            operators.append(operator)
+            terms.append(number)
+    result = terms[0]
+    for operator, term in zip(operators, terms[1:]):
+        result = result + term if operator == '+' else result - term
+    return result
+
+
+def parse_line(line, check_answers=False):
+    line = line.translate(ALIAS_TABLE)
+    simple = SIMPLE.fullmatch(line)
+    if simple:
+        left, operator, right, answer = simple.groups()
+        tokens = [int(left), operator, int(right)]
+        answer = int(answer)
+    else:
+        if '=' not in line:
+            raise ExampleError("нет знака =")
+        expression, answer = line.split('=', 1)
+        tokens = tokenize(expression)
+        match = ANSWER.fullmatch(answer)
+        if not match:
+            raise ExampleError("ответ не число")
+        answer = int(match.group(1))
+    if check_answers and evaluate(tokens) != answer:
+        raise ExampleError("неверный ответ")
+    # Пример хранится в том же виде, что и в examples.txt: без пробелов
+    return ''.join(str(token) for token in tokens), answer
+
+
+def parse_example_lines(lines, check_answers=False, report=None, examples=None):
+    report = report or ExampleReport()
+    examples = ExampleIndex() if examples is None else examples
+    for line in lines:
+        report.lines += 1
+        line = line.strip()
+        if not line or line.startswith('#'):
+            report.blank += 1
+            continue
+        try:
+            example, answer = parse_line(line, check_answers)
+        except ExampleError as e:
+            report.add_error(report.lines, line, str(e))
+            continue
+        known = examples.get(example)
+        if known is None:
+            examples[example] = answer
+            report.accepted += 1
+        elif known == answer:
+            report.duplicates += 1
+        else:
+            report.add_error(report.lines, line, "другой ответ у повторного примера")
+    return examples, report
+
+
+# Чтение порциями по CHUNK_SIZE: в памяти только текущая порция и итоговый словарь.
+# utf-8-sig убирает BOM, универсальные переводы строк превращают \r\n в \n.
+def iter_file_lines(path, chunk_size=CHUNK_SIZE):
+    with open(path, "r", encoding="utf-8-sig", newline=None) as f:
+        tail = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).split("\n")
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+
+
+def parse_examples_file(path, check_answers=False, chunk_size=CHUNK_SIZE):
+    return parse_example_lines(iter_file_lines(path, chunk_size), check_answers)
+
+
+# Генератор примеров под нужный ответ за O(1) вместо поиска по файлу.
+# Все случайные решения идут через собственный Random, поэтому при одном и том же seed
+# и одной и той же последовательности вызовов получаются те же примеры (для повторов игр).
+class ExampleGenerator:
+    def __init__(self, operators=('+', '-', '*'), max_operand=499, max_factor=29,
+                 base_operand=20, seed=None, attempts=8):
+        self.operators = tuple(operators)
+        self.max_operand = max_operand
+        self.max_factor = max_factor
+        self.base_operand = base_operand
+        self.attempts = attempts
+        self.rng = random.Random(seed)
+
+    # Сложность растет с уровнем: на первом уровне числа до base_operand
+    def operand_limit(self, level):
+        return min(self.max_operand, self.base_operand * max(1, level))
+
+    def factor_limit(self, level):
+        return min(self.max_factor, max(2, self.operand_limit(level) // 4))
+
+    # Ответ с поля может быть больше, чем позволяет уровень: тогда диапазон расширяется
+    # до ответа плюс запас уровня, чтобы у сложения и вычитания был выбор операндов.
+    # Верхняя граница max_operand, если ответ не больше двух max_operand
+    def answer_limit(self, answer, level):
+        limit = self.operand_limit(level)
+        if abs(answer) <= limit:
+            return limit
+        return max(min(abs(answer) + limit, self.max_operand), (abs(answer) + 1) // 2)
+
+    def example_for(self, answer, level=1):
+        limit = self.answer_limit(answer, level)
+        operators = list(self.operators)
+        self.rng.shuffle(operators)
+        for operator in operators:
+            operands = self.operands(operator, answer, limit, self.factor_limit(level))
+            if operands is not None:
+                return f"{operands[0]}{operator}{operands[1]}", answer
+        # Ни один оператор не уложился в пределы: простейший пример с одним из заданных операторов
+        # (a*1, a/1, a-0). Отрицательный ответ только умножением и делением не записать,
+        # тогда используется вычитание 0-a
+        for operator in operators:
+            operands = self.trivial_operands(operator, answer)
+            if operands is not None:
+                return f"{operands[0]}{operator}{operands[1]}", answer
+        return f"0-{-answer}", answer
+
+    def trivial_operands(self, operator, answer):
+        if operator == '-':
+            return (answer, 0) if answer >= 0 else (0, -answer)
+        if answer < 0:
+            return None
+        if operator == '+':
+            a = self.rng.randint(0, answer)
+            return a, answer - a
+        if operator in ('*', '/'):
+            return answer, 1
+        return None
+
+    def operands(self, operator, answer, limit, factor_limit):
+        rng = self.rng
+        if operator == '+':
+            low, high = max(0, answer - limit), min(limit, answer)
+            if low > high:
+                return None
+            a = rng.randint(low, high)
+            return a, answer - a
+        if operator == '-':
+            low, high = max(0, -answer), min(limit, limit - answer)
+            if low > high:
+                return None
+            b = rng.randint(low, high)
+            return answer + b, b
+        if operator == '*':
+            if answer == 0:
+                return 0, rng.randint(0, factor_limit)
+            if answer < 0:
+                return None
+            # Ограниченное число попыток найти делитель, чтобы не раскладывать число на множители
+            for _ in range(self.attempts):
+                d = rng.randint(1, min(factor_limit, answer))
+                if answer % d == 0 and answer // d <= factor_limit:
+                    return answer // d, d
+            return None
+        if operator == '/':
+            if answer < 0:
+                return None
+            high = min(factor_limit, limit // answer) if answer else factor_limit
+            if high < 1:
+                return None
+            b = rng.randint(1, high)
+            return answer * b, b
+        return None
+
+    def random_example(self, level=1, max_answer=None):
+        limit = self.operand_limit(level)
+        if max_answer is not None:
+            limit = min(limit, max_answer)
+        return self.example_for(self.rng.randint(0, max(0, limit)), level)
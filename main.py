@@ -1,11 +1,18 @@
 import pygame
 import random
 import sys
-import sqlite3
-from datetime import datetime
+from array import array
+from collections import Counter, OrderedDict
+from functools import lru_cache
 import tkinter as tk
 from tkinter import filedialog
 
+from controls import InputHandler
+from examples import ExampleGenerator, ExampleIndex, parse_example_lines, parse_examples_file
+from memtrack import MemoryTracker, memtrack_enabled
+from scores import init_db, save_score, top_scores
+from telemetry import SessionTelemetry, Telemetry, telemetry_enabled
+
 pygame.init()
 pygame.mixer.init()
 
@@ -21,6 +28,25 @@ GRID_HEIGHT = 20
 GRID_OFFSET_X = (SCREEN_WIDTH - BLOCK_SIZE * GRID_WIDTH) // 2
 GRID_OFFSET_Y = SCREEN_HEIGHT - BLOCK_SIZE * GRID_HEIGHT - 50
 
+# Область экрана под поле: слева и справа остаются панели с примером, счетом и следующей фигурой
+VIEW_WIDTH = SCREEN_WIDTH - 320
+VIEW_HEIGHT = BLOCK_SIZE * GRID_HEIGHT
+MIN_BLOCK_SIZE = 4
+# Кубиков с числами в режиме с примерами сотни разных, кэш их поверхностей ограничен
+VALUE_SURFACE_LIMIT = 64
+
+# Эффекты взрывов: кадров в анимации, длительность кадра и размер пула на одно поле
+EXPLOSION_FRAMES = 13
+EXPLOSION_FRAME_MS = 100
+EXPLOSION_POOL_SIZE = 32
+
+# Уровень в режиме с примерами не растет, поэтому сложность примеров растет каждые EXAMPLE_LEVEL_PIECES фигур
+EXAMPLE_LEVEL_PIECES = 20
+
+# Шаг симуляции и предел догоняющих шагов за один кадр
+SIM_TICK_MS = 10
+MAX_CATCH_UP_TICKS = 25
+
 # Цвета
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -33,6 +59,7 @@ COLORS = [
     (255, 0, 0),
     (0, 255, 0)
 ]
+GARBAGE_COLOR = (128, 128, 128)
 
 # Фигуры
 SHAPES = [
@@ -46,99 +73,609 @@ SHAPES = [
 ]
 
 
-# Инициализация базы данных
-def init_db():
-    conn = sqlite3.connect("data/tetris_scores.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS scores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            player_name TEXT NOT NULL,
-            score INTEGER NOT NULL,
-            level INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            mode TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-
-# Сохранение результатов в таблицу лидеров
-def save_score(player_name, score, level, mode):
-    conn = sqlite3.connect("data/tetris_scores.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO scores (player_name, score, level, date, mode)
-        VALUES (?, ?, ?, ?, ?)
-    """, (player_name, score, level, datetime.now().strftime("%d.%m.%Y"), mode))
-    conn.commit()
-    conn.close()
-
-
-class Block(pygame.sprite.Sprite):
-    def __init__(self, color=None, image=None, x=0, y=0, value=None):
-        super().__init__()
-        self.base_image = image.copy() if image else pygame.Surface((BLOCK_SIZE - 1, BLOCK_SIZE - 1))
+# Размеры поля задаются для каждой игры отдельно.
+# Если поле не помещается в VIEW_WIDTH x VIEW_HEIGHT, блоки уменьшаются (но не меньше MIN_BLOCK_SIZE),
+# а не поместившееся по вертикали поле прокручивается вслед за текущей фигурой.
+class BoardSettings:
+    def __init__(self, name, width, height, block_size=BLOCK_SIZE,
+                 view_size=(VIEW_WIDTH, VIEW_HEIGHT), surface_size=(SCREEN_WIDTH, SCREEN_HEIGHT), bottom_margin=50):
+        view_width, view_height = view_size
+        if width * MIN_BLOCK_SIZE > view_width:
+            raise ValueError(f"Поле шириной {width} не помещается на экран (максимум {view_width // MIN_BLOCK_SIZE})")
+        self.name = name
+        self.width = width
+        self.height = height
+        self.block_size = max(MIN_BLOCK_SIZE, min(block_size, view_width // width, view_height // height))
+        self.visible_rows = min(height, view_height // self.block_size)
+        self.offset_x = (surface_size[0] - self.block_size * width) // 2
+        self.offset_y = surface_size[1] - self.block_size * self.visible_rows - bottom_margin
+        self.view_rect = pygame.Rect(
+            self.offset_x, self.offset_y, width * self.block_size, self.visible_rows * self.block_size)
+
+    # Верхняя видимая строка: фигура держится в верхней четверти окна
+    def scroll_for(self, piece):
+        if self.visible_rows >= self.height or piece is None:
+            return 0
+        return max(0, min(piece['y'] - self.visible_rows // 4, self.height - self.visible_rows))
+
+    def to_screen(self, x, y, scroll_row=0):
+        return (self.offset_x + x * self.block_size, self.offset_y + (y - scroll_row) * self.block_size)
+
+
+DEFAULT_BOARD = BoardSettings("10x20", GRID_WIDTH, GRID_HEIGHT)
+# Стресс-режим для марафонов. Цели на одном ядре: кадр не дольше 16 мс (60 FPS),
+# фиксация фигуры (lock_piece вместе с очисткой линий или слияниями) не дольше 2 мс.
+# Очистка 4 линий при 100 заполненных строках: около 0.5 мс с отрисовкой слоя, 0.1 мс без нее.
+STRESS_BOARD = BoardSettings("100x400", 100, 400)
+BOARD_PRESETS = [
+    DEFAULT_BOARD,
+    BoardSettings("20x40", 20, 40),
+    STRESS_BOARD
+]
+
+
+def fall_speed_for_level(level):
+    return max(100, 1000 - (level - 1) * 100)
+
+
+# Фиксированный шаг симуляции: логика идет шагами по tick_ms независимо от частоты кадров.
+# Время кадров копится в аккумуляторе. После зависания за кадр выполняется не больше max_ticks шагов,
+# остальное время отбрасывается, чтобы игра не ушла в бесконечное догоняние. speed > 1 ускоряет игру.
+class SimulationClock:
+    def __init__(self, tick_ms=SIM_TICK_MS, max_ticks=MAX_CATCH_UP_TICKS, speed=1):
+        self.tick_ms = tick_ms
+        self.max_ticks = max_ticks
+        self.speed = speed
+        self.accumulator = 0
+        self.ticks = 0
+        self.dropped_ms = 0
+
+    def advance(self, elapsed_ms):
+        self.accumulator += elapsed_ms * self.speed
+        ticks = int(self.accumulator // self.tick_ms)
+        if ticks > self.max_ticks:
+            self.dropped_ms += (ticks - self.max_ticks) * self.tick_ms
+            self.accumulator -= (ticks - self.max_ticks) * self.tick_ms
+            ticks = self.max_ticks
+        self.accumulator -= ticks * self.tick_ms
+        self.ticks += ticks
+        return ticks
+
+    # Доля следующего шага, прошедшая к моменту кадра
+    @property
+    def alpha(self):
+        return self.accumulator / self.tick_ms
+
+
+# Один шаг симуляции. Время падения и скорость хранятся в самой игре,
+# остаток времени переносится на следующее падение, а не обнуляется.
+def step_game(game, tick_ms, soft_dropping=False):
+    if game.paused or game.game_over:
+        return
+    piece = game.current_piece
+    game.last_piece_y = (piece, piece['y']) if piece else None
+    game.sim_time += tick_ms
+    # Пока зажата клавиша вниз, падением управляет InputHandler
+    if soft_dropping:
+        game.fall_time = 0
+        return
+    game.fall_time += tick_ms
+    while game.fall_time >= game.fall_speed and not game.game_over:
+        game.fall_time -= game.fall_speed
+        game.drop()
+
+
+# Отрисовка между шагами: фигура рисуется между положением на прошлом шаге и текущим,
+# эффекты получают время симуляции с учетом доли шага
+def interpolate_game(game, alpha, tick_ms=SIM_TICK_MS):
+    previous = game.last_piece_y
+    piece = game.current_piece
+    game.piece_draw_y = None
+    if previous and piece is previous[0] and piece['y'] != previous[1]:
+        game.piece_draw_y = previous[1] + (piece['y'] - previous[1]) * alpha
+    game.explosions.update(game.sim_time + int(alpha * tick_ms))
+
+
+# Симуляция без отрисовки и ожидания кадров: быстрее реального времени (боты, прогоны, проверки)
+def run_simulation(game, duration_ms, tick_ms=SIM_TICK_MS, on_tick=None):
+    ticks = 0
+    while ticks * tick_ms < duration_ms and not game.game_over:
+        if on_tick is not None:
+            on_tick(game)
+        step_game(game, tick_ms)
+        ticks += 1
+    return ticks
+
+
+# Общие (flyweight) поверхности блоков: одна на цвет и одна на пару (текстура, значение)
+_font_cache = {}
+_texture_cache = {}
+_block_surface_cache = {}
+_value_surface_cache = OrderedDict()
+_examples_cache = {}
+_explosion_frames = []
+_row_explosion_cache = {}
+
+
+def get_font(size):
+    font = _font_cache.get(size)
+    if font is None:
+        font = pygame.font.Font(None, size)
+        _font_cache[size] = font
+    return font
+
+
+# Отрисованные строки текста общие для всех экранов и полей
+@lru_cache(maxsize=1024)
+def render_text(text, size, color=WHITE):
+    return get_font(size).render(text, True, color)
+
+
+def load_texture(path, size):
+    key = (path, size)
+    texture = _texture_cache.get(key)
+    if texture is None:
+        texture = pygame.image.load(path)
+        # Без окна (сервер, тесты) convert_alpha недоступен
+        if pygame.display.get_surface() is not None:
+            texture = texture.convert_alpha()
+        texture = pygame.transform.scale(texture, size)
+        _texture_cache[key] = texture
+    return texture
+
+
+def get_block_surface(color=None, image=None, value=None, size=BLOCK_SIZE):
+    # Поверхности общие для всех блоков, поэтому их нельзя изменять после создания.
+    # Цветов мало, они хранятся всегда; кубики с числами вытесняются по LRU
+    key = (color, image, value, size)
+    cache = _block_surface_cache if value is None else _value_surface_cache
+    surface = cache.get(key)
+    if surface is None:
+        surface = image.copy() if image else pygame.Surface((size - 1, size - 1))
         if color:
-            self.base_image.fill(color)
-        self.image = self.base_image.copy()
-        self.rect = self.image.get_rect(topleft=(x, y))
-        self.value = value
-        if self.value is not None:
-            self.add_text(str(self.value))
-
-    def add_text(self, text):
-        font = pygame.font.Font(None, 24)
-        text_surface = font.render(text, True, WHITE)
-        text_rect = text_surface.get_rect(center=self.image.get_rect().center)
-        self.image = self.base_image.copy()
-        self.image.blit(text_surface, text_rect)
-
-    def update_value(self, new_value):
-        self.value = new_value
-        self.add_text(str(new_value))
-
-
-class Explosion(pygame.sprite.Sprite):
-    def __init__(self, x, y):
-        super().__init__()
-        self.frames = [
-            pygame.image.load(f"Sprites/explosion_{i}.png") for i in range(1, 14)
-        ]
-        self.current_frame = 0
-        self.image = self.frames[self.current_frame]
-        self.rect = self.image.get_rect(center=(x, y))
-        self.animation_speed = 100
-        self.last_update = pygame.time.get_ticks()
-
-    def update(self):
-        now = pygame.time.get_ticks()
-        if now - self.last_update > self.animation_speed:
-            self.last_update = now
-            self.current_frame += 1
-            if self.current_frame >= len(self.frames):
-                self.kill()
+            surface.fill(color)
+        if value is not None:
+            text_surface = get_font(max(8, size * 4 // 5)).render(str(value), True, WHITE)
+            surface.blit(text_surface, text_surface.get_rect(center=surface.get_rect().center))
+            if len(cache) >= VALUE_SURFACE_LIMIT:
+                cache.popitem(last=False)
+        cache[key] = surface
+    elif value is not None:
+        cache.move_to_end(key)
+    return surface
+
+
+def get_ghost_surface(size=BLOCK_SIZE):
+    key = ('ghost', size)
+    surface = _block_surface_cache.get(key)
+    if surface is None:
+        surface = pygame.Surface((size - 1, size - 1), pygame.SRCALPHA)
+        pygame.draw.rect(surface, (255, 255, 255, 110), surface.get_rect(), max(1, size // 10))
+        _block_surface_cache[key] = surface
+    return surface
+
+
+# Кадры взрыва загружаются один раз и общие для всех эффектов
+def get_explosion_frames():
+    if not _explosion_frames:
+        for i in range(1, EXPLOSION_FRAMES + 1):
+            frame = pygame.image.load(f"Sprites/explosion_{i}.png")
+            if pygame.display.get_surface() is not None:
+                frame = frame.convert_alpha()
+            _explosion_frames.append(frame)
+    return _explosion_frames
+
+
+# Взрыв целой строки: взрывы всех клеток заранее сведены в одну полосу на каждый кадр,
+# поэтому снятая строка рисуется одним blit вместо width спрайтов
+def get_row_explosion_frames(block_size, count):
+    key = (block_size, count)
+    frames = _row_explosion_cache.get(key)
+    if frames is None:
+        frames = []
+        for frame in get_explosion_frames():
+            strip = pygame.Surface((block_size * (count - 1) + frame.get_width(), frame.get_height()),
+                                   pygame.SRCALPHA)
+            for x in range(count):
+                strip.blit(frame, (x * block_size, 0))
+            frames.append(strip)
+        _row_explosion_cache[key] = frames
+    return frames
+
+
+# Ячейка пула эффектов: одиночный взрыв клетки или взрыв строки, кадры общие
+class Explosion:
+    def __init__(self):
+        self.frames = None
+        self.image = None
+        self.rect = None
+        self.start = 0
+
+    def reset(self, frames, center, start):
+        self.frames = frames
+        self.image = frames[0]
+        self.rect = self.image.get_rect(center=center)
+        self.start = start
+
+
+# Пул эффектов фиксированного размера: экземпляры переиспользуются, а если пул занят,
+# переиспользуется самый старый эффект. Все активные эффекты продвигаются
+# от одних общих часов за один проход.
+class ExplosionPool:
+    def __init__(self, size=EXPLOSION_POOL_SIZE, frame_ms=EXPLOSION_FRAME_MS, clock=pygame.time.get_ticks):
+        self.free = [Explosion() for _ in range(size)]
+        self.active = []
+        self.frame_ms = frame_ms
+        self.clock = clock
+        self.spawned = 0
+        self.recycled = 0
+
+    def __len__(self):
+        return len(self.active)
+
+    def __iter__(self):
+        return iter(self.active)
+
+    def acquire(self):
+        if self.free:
+            explosion = self.free.pop()
+        else:
+            explosion = self.active.pop(0)
+            self.recycled += 1
+        self.active.append(explosion)
+        self.spawned += 1
+        return explosion
+
+    def spawn(self, x, y):
+        self.acquire().reset(get_explosion_frames(), (x, y), self.clock())
+
+    def spawn_row(self, y, count, block_size):
+        frames = get_row_explosion_frames(block_size, count)
+        self.acquire().reset(frames, (count * block_size // 2, y), self.clock())
+
+    def update(self, now=None):
+        now = self.clock() if now is None else now
+        kept = 0
+        for explosion in self.active:
+            frame = (now - explosion.start) // self.frame_ms
+            if frame >= len(explosion.frames):
+                self.free.append(explosion)
+                continue
+            explosion.image = explosion.frames[frame]
+            self.active[kept] = explosion
+            kept += 1
+        del self.active[kept:]
+
+    def empty(self):
+        self.free.extend(self.active)
+        self.active.clear()
+
+
+# Отрисовка видимой части поля: один blit из слоя поля вместо обхода всех клеток
+def draw_board_view(screen, game):
+    board = game.board
+    # После restore без отрисовки слой поля перерисовывается при первом показе
+    if game.board_stale:
+        game.render_board()
+    area = pygame.Rect(0, game.scroll_row * game.block_size, board.view_rect.width, board.view_rect.height)
+    screen.blit(game.board_surface, board.view_rect.topleft, area)
+
+
+def draw_piece(screen, game):
+    piece = game.current_piece
+    surface = game.piece_surface()
+    top = piece['y'] if game.piece_draw_y is None else game.piece_draw_y
+    screen.set_clip(game.board.view_rect)
+    for y, row in enumerate(piece['shape']):
+        for x, cell in enumerate(row):
+            if cell:
+                screen.blit(surface, game.board.to_screen(piece['x'] + x, top + y, game.scroll_row))
+    screen.set_clip(None)
+
+
+# Тень фигуры в точке падения: контур, точка падения берется из профиля столбцов
+def draw_ghost(screen, game):
+    piece = game.current_piece
+    distance = game.drop_distance()
+    if not distance:
+        return
+    surface = get_ghost_surface(game.block_size)
+    screen.set_clip(game.board.view_rect)
+    for y, row in enumerate(piece['shape']):
+        for x, cell in enumerate(row):
+            if cell:
+                screen.blit(surface, game.board.to_screen(
+                    piece['x'] + x, piece['y'] + y + distance, game.scroll_row))
+    screen.set_clip(None)
+
+
+# Взрывы хранятся в координатах поля и сдвигаются на экран с учетом прокрутки
+def draw_explosions(screen, game):
+    dx = game.board.offset_x
+    dy = game.board.offset_y - game.scroll_row * game.block_size
+    scrolling = game.board.visible_rows < game.height
+    if scrolling:
+        screen.set_clip(game.board.view_rect)
+    for explosion in game.explosions:
+        screen.blit(explosion.image, explosion.rect.move(dx, dy))
+    if scrolling:
+        screen.set_clip(None)
+
+
+# Строки поля из буферов board_key(): битовая карта занятости и массив значений
+def cells_to_rows(cells, width, height):
+    size = (width * height + 7) // 8
+    bits = int.from_bytes(cells[:size], 'little')
+    values = array('i')
+    values.frombytes(cells[size:])
+    return tuple(
+        tuple(values[i] if bits >> i & 1 else None for i in range(y * width, (y + 1) * width))
+        for y in range(height)
+    )
+
+
+# Неизменяемый снимок поля для перебора ходов (подсказки, боты, оценка "что если").
+# Строки хранятся кортежами, поэтому копирование снимка бесплатное,
+# а with_cells создает новый снимок, разделяя с исходным все нетронутые строки
+# (в режиме с примерами правит копию буферов поля, чтобы ключ сравнения не зависел от способа сборки).
+# Кроме поля в снимке лежит все, от чего зависит продолжение партии: счетчики, таймер падения,
+# состояние генератора случайных чисел. profile - готовый профиль столбцов, чтобы restore не пересчитывал поле.
+# Поле режима с примерами хранится буферами board_key() в cells, строки из них собираются только по запросу.
+class BoardSnapshot:
+    __slots__ = ('_rows', 'score', 'level', 'current_piece', 'next_piece', 'piece_count',
+                 'lines', 'exploded', 'game_over', 'fall_time', 'rng_state', 'profile',
+                 'cells', 'size', 'value_counts', '_hash')
+
+    def __init__(self, rows, score, level, current_piece, next_piece=None, piece_count=0,
+                 lines=0, exploded=0, game_over=False, fall_time=0, rng_state=None, profile=None,
+                 cells=None, size=None, value_counts=None):
+        self._rows = rows
+        self.score = score
+        self.level = level
+        self.current_piece = current_piece
+        self.next_piece = next_piece
+        self.piece_count = piece_count
+        self.lines = lines
+        self.exploded = exploded
+        self.game_over = game_over
+        self.fall_time = fall_time
+        self.rng_state = rng_state
+        self.profile = profile
+        self.cells = cells
+        self.size = size
+        self.value_counts = value_counts
+        self._hash = None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = cells_to_rows(self.cells, *self.size)
+        return self._rows
+
+    def cell(self, x, y):
+        return self.rows[y][x]
+
+    def with_cells(self, cells, score=None, level=None):
+        # cells: итерируемое из (x, y, значение)
+        if self.cells is not None:
+            return self.with_buffer_cells(cells, score, level)
+        rows = list(self.rows)
+        changed = {}
+        for x, y, value in cells:
+            row = changed.get(y)
+            if row is None:
+                row = changed[y] = list(rows[y])
+            row[x] = value
+        for y, row in changed.items():
+            rows[y] = tuple(row)
+        # Профиль после правки клеток устарел, restore пересчитает его сам
+        return BoardSnapshot(
+            tuple(rows),
+            self.score if score is None else score,
+            self.level if level is None else level,
+            self.current_piece,
+            self.next_piece,
+            self.piece_count,
+            self.lines,
+            self.exploded,
+            self.game_over,
+            self.fall_time,
+            self.rng_state
+        )
+
+    # Снимок режима с примерами остается в виде буферов: так ключ сравнения у одинаковых позиций один и тот же.
+    # Пустая клетка хранит значение 0, как после clear_cell
+    def with_buffer_cells(self, cells, score=None, level=None):
+        width, height = self.size
+        size = (width * height + 7) // 8
+        occupied = bytearray(self.cells[:size])
+        values = array('i')
+        values.frombytes(self.cells[size:])
+        for x, y, value in cells:
+            i = y * width + x
+            if value is None:
+                occupied[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+                values[i] = 0
+            else:
+                occupied[i >> 3] |= 1 << (i & 7)
+                values[i] = value
+        return BoardSnapshot(
+            None,
+            self.score if score is None else score,
+            self.level if level is None else level,
+            self.current_piece,
+            self.next_piece,
+            self.piece_count,
+            self.lines,
+            self.exploded,
+            self.game_over,
+            self.fall_time,
+            self.rng_state,
+            cells=bytes(occupied) + values.tobytes(),
+            size=self.size
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, BoardSnapshot):
+            return NotImplemented
+        return self._key() == other._key()
+
+    # Снимок не меняется, поэтому хеш считается один раз: в таблицах перебора он нужен на каждый поиск
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._key())
+        return self._hash
+
+    # Таймер, генератор и профиль в сравнение не входят: одинаковые позиции должны совпадать
+    def _key(self):
+        board = self.cells if self.cells is not None else self.rows
+        return (board, self.score, self.level, self.current_piece, self.next_piece, self.piece_count,
+                self.lines, self.exploded, self.game_over)
+
+
+def freeze_piece(piece):
+    if piece is None:
+        return None
+    frozen = dict(piece)
+    frozen['shape'] = tuple(tuple(row) for row in piece['shape'])
+    return tuple(sorted(frozen.items(), key=lambda item: item[0]))
+
+
+def thaw_piece(frozen):
+    if frozen is None:
+        return None
+    return dict(frozen)
+
+
+# Профиль столбцов: верхняя занятая строка и число дыр под ней в каждом столбце.
+# Обновляется при фиксации и очистке, поэтому точка падения, тень фигуры и признаки
+# для ботов (высоты, неровность, дыры) считаются без обхода всего поля.
+class ColumnProfile:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.tops = [height] * width
+        self.holes = [0] * width
+
+    def fill(self, x, y):
+        top = self.tops[x]
+        if y < top:
+            self.holes[x] += top - y - 1
+            self.tops[x] = y
+        elif y > top:
+            self.holes[x] -= 1
+
+    # Полный пересчет одного столбца; is_filled(x, y) сообщает, занята ли клетка
+    def rescan(self, x, is_filled):
+        top = self.height
+        holes = 0
+        for y in range(self.height):
+            if is_filled(x, y):
+                if top == self.height:
+                    top = y
+            elif top != self.height:
+                holes += 1
+        self.tops[x] = top
+        self.holes[x] = holes
+
+    def clear(self, x, y, is_filled):
+        if y == self.tops[x]:
+            self.rescan(x, is_filled)
+        elif y > self.tops[x]:
+            self.holes[x] += 1
+
+    def rescan_all(self, is_filled):
+        for x in range(self.width):
+            self.rescan(x, is_filled)
+
+    # Удалены заполненные строки (вызывается после сдвига поля). Верх каждого столбца
+    # не ниже удаленных строк: если он уцелел, столбец просто сдвигается вниз,
+    # иначе столбец пересчитывается
+    def remove_rows(self, rows, is_filled):
+        for x in range(self.width):
+            if self.tops[x] in rows:
+                self.rescan(x, is_filled)
             else:
-                self.image = self.frames[self.current_frame]
+                self.tops[x] += len(rows)
+
+    def state(self):
+        return tuple(self.tops), tuple(self.holes)
+
+    def load(self, state):
+        tops, holes = state
+        self.tops[:] = tops
+        self.holes[:] = holes
+
+    def heights(self):
+        return [self.height - top for top in self.tops]
+
+    # На сколько строк фигура упадет. None, если фигура под нависающими блоками
+    # и по профилю это не определить
+    def drop_distance(self, shape, px, py):
+        distance = None
+        bottoms = {}
+        for y, row in enumerate(shape):
+            for x, cell in enumerate(row):
+                if cell:
+                    bottoms[px + x] = py + y
+        for x, y in bottoms.items():
+            if y >= self.tops[x]:
+                return None
+            column_distance = self.tops[x] - y - 1
+            if distance is None or column_distance < distance:
+                distance = column_distance
+        return distance
+
+    def features(self):
+        heights = self.heights()
+        return {
+            'aggregate_height': sum(heights),
+            'max_height': max(heights),
+            'bumpiness': sum(abs(a - b) for a, b in zip(heights, heights[1:])),
+            'holes': sum(self.holes)
+        }
 
 
 class Tetris:
-    def __init__(self):
-        self.grid = [[0] * GRID_WIDTH for _ in range(GRID_HEIGHT)]
+    def __init__(self, board=None, headless=False, seed=None):
+        self.board = board or DEFAULT_BOARD
+        self.rng = random.Random(seed)
+        self.headless = headless
+        self.width = self.board.width
+        self.height = self.board.height
+        self.block_size = self.board.block_size
+        self.grid = [[0] * self.width for _ in range(self.height)]
         self.score = 0
+        self.lines = 0
         self.level = 1
         self.current_piece = None
         self.next_piece = None
         self.game_over = False
-        self.all_sprites = pygame.sprite.Group()
-        self.explosions = pygame.sprite.Group()
+        # Часы симуляции и падение фигуры, см. step_game
+        self.sim_time = 0
+        self.fall_time = 0
+        self.fall_speed = fall_speed_for_level(self.level)
+        self.last_piece_y = None
+        self.piece_draw_y = None
+        self.explosions = ExplosionPool(clock=lambda: self.sim_time)
         self.paused = False
+        self.scroll_row = 0
+        self.board_version = 0
+        self.board_stale = False
+        self.profile = ColumnProfile(self.width, self.height)
+        # Без отрисовки (сервер) слой поля и эффекты не создаются
+        self.board_surface = None
+        if not headless:
+            self.board_surface = pygame.Surface((self.width * self.block_size, self.height * self.block_size))
+            # Кадры взрыва строки собираются заранее, а не на первой очистке посреди игры
+            get_row_explosion_frames(self.block_size, self.width)
+        self.render_board()
         self.new_piece()
 
     def draw_border(self, screen):
         pygame.draw.rect(screen, WHITE, (
-            GRID_OFFSET_X - 2, GRID_OFFSET_Y - 2, GRID_WIDTH * BLOCK_SIZE + 4, GRID_HEIGHT * BLOCK_SIZE + 4), 2)
+            self.board.offset_x - 2, self.board.offset_y - 2,
+            self.width * self.block_size + 4, self.board.visible_rows * self.block_size + 4), 2)
 
     def draw_next_piece(self, screen):
         if self.next_piece is not None:
@@ -162,7 +699,7 @@ class Tetris:
                         ))
 
     def draw_score_and_level(self, screen):
-        font = pygame.font.Font(None, 36)
+        font = get_font(36)
         score_text = font.render(f"Счет: {self.score}", True, WHITE)
         level_text = font.render(f"Уровень: {self.level}", True, WHITE)
         screen.blit(score_text, (SCREEN_WIDTH - 150, 200))
@@ -170,13 +707,13 @@ class Tetris:
 
     def new_piece(self):
         if not self.next_piece:
-            self.next_piece = random.choice(range(len(SHAPES)))
+            self.next_piece = self.rng.choice(range(len(SHAPES)))
 
         # Создание фигуры
         self.current_piece = {
             'shape': SHAPES[self.next_piece],
             'color': COLORS[self.next_piece],
-            'x': GRID_WIDTH // 2 - len(SHAPES[self.next_piece][0]) // 2,
+            'x': self.width // 2 - len(SHAPES[self.next_piece][0]) // 2,
             'y': 0
         }
 
@@ -186,15 +723,15 @@ class Tetris:
             return
 
         # Создание следующей фигуры для показа
-        self.next_piece = random.choice(range(len(SHAPES)))
+        self.next_piece = self.rng.choice(range(len(SHAPES)))
 
     def check_collision(self, shape, offset):
         dx, dy = offset
         for y, row in enumerate(shape):
             for x, cell in enumerate(row):
                 if cell:
-                    if x + dx < 0 or x + dx >= GRID_WIDTH or \
-                            y + dy >= GRID_HEIGHT or \
+                    if x + dx < 0 or x + dx >= self.width or \
+                            y + dy >= self.height or \
                             (y + dy >= 0 and self.grid[y + dy][x + dx]):
                         return True
         return False
@@ -218,8 +755,26 @@ class Tetris:
         if not self.move(0, 1):
             self.lock_piece()
 
+    def is_filled(self, x, y):
+        return bool(self.grid[y][x])
+
+    # Расстояние до точки падения: по профилю столбцов, а под нависающими блоками пошагово
+    def drop_distance(self):
+        piece = self.current_piece
+        distance = self.profile.drop_distance(piece['shape'], piece['x'], piece['y'])
+        if distance is None:
+            distance = 0
+            while not self.check_collision(piece['shape'], (piece['x'], piece['y'] + distance + 1)):
+                distance += 1
+        return distance
+
+    def hard_drop(self):
+        self.current_piece['y'] += self.drop_distance()
+        self.lock_piece()
+
     def lock_piece(self):
         shape = self.current_piece['shape']
+        rows = set()
         for y, row in enumerate(shape):
             for x, cell in enumerate(row):
                 if cell:
@@ -228,121 +783,205 @@ class Tetris:
                         self.game_over = True
                         return
                     # Размещаем фигуру на поле
-                    self.grid[self.current_piece['y'] + y][self.current_piece['x'] + x] = self.current_piece['color']
-                    block = Block(
-                        color=self.current_piece['color'],
-                        x=GRID_OFFSET_X + (self.current_piece['x'] + x) * BLOCK_SIZE,
-                        y=GRID_OFFSET_Y + (self.current_piece['y'] + y) * BLOCK_SIZE
-                    )
-                    self.all_sprites.add(block)
-
-        self.clear_lines()
+                    gx = self.current_piece['x'] + x
+                    gy = self.current_piece['y'] + y
+                    self.grid[gy][gx] = self.current_piece['color']
+                    self.profile.fill(gx, gy)
+                    self.paint_cell(gx, gy)
+                    rows.add(gy)
+
+        self.clear_lines(rows)
         self.new_piece()
 
-    def clear_lines(self):
-        lines_cleared = 0
-        rows_to_remove = []
-        for y in range(GRID_HEIGHT):
-            if all(self.grid[y]):
-                rows_to_remove.append(y)
-                lines_cleared += 1
+    def clear_lines(self, rows=None):
+        # Заполниться могли только строки последней фигуры
+        if rows is None:
+            rows = range(self.height)
+        rows_to_remove = sorted(y for y in rows if all(self.grid[y]))
+        lines_cleared = len(rows_to_remove)
 
         if rows_to_remove:
-            # Удаление заполненых строк и создание взрыва
-            for y in rows_to_remove:
-                for x in range(GRID_WIDTH):
-                    for block in self.all_sprites:
-                        if block.rect.collidepoint(
-                                GRID_OFFSET_X + x * BLOCK_SIZE + BLOCK_SIZE // 2,
-                                GRID_OFFSET_Y + y * BLOCK_SIZE + BLOCK_SIZE // 2
-                        ):
-                            block.kill()
-                        explosion = Explosion(
-                            GRID_OFFSET_X + x * BLOCK_SIZE + BLOCK_SIZE // 2,
-                            GRID_OFFSET_Y + y * BLOCK_SIZE + BLOCK_SIZE // 2
-                        )
-                        self.explosions.add(explosion)
-                        explosion_sound.play()
+            self.lines += lines_cleared
+            # Создание взрыва на месте удаляемых строк: один эффект и один звук на строку
+            if not self.headless:
+                half = self.block_size // 2
+                for y in rows_to_remove:
+                    self.explosions.spawn_row(y * self.block_size + half, self.width, self.block_size)
+                explosion_sound.play()
 
             # Падение оставшихся строк вниз
-            for y in reversed(range(GRID_HEIGHT)):
-                if y in rows_to_remove:
-                    continue  # Пропускаем удаленные строки
-                new_y = y + lines_cleared
-                if new_y < GRID_HEIGHT:
-                    self.grid[new_y] = self.grid[y]
-                self.grid[y] = [0] * GRID_WIDTH
-
-            # Обновление спрайтов
-            self.all_sprites.empty()
-            for y in range(GRID_HEIGHT):
-                for x in range(GRID_WIDTH):
-                    if self.grid[y][x]:
-                        block = Block(
-                            color=self.grid[y][x],
-                            x=GRID_OFFSET_X + x * BLOCK_SIZE,
-                            y=GRID_OFFSET_Y + y * BLOCK_SIZE
-                        )
-                        self.all_sprites.add(block)
+            removed = set(rows_to_remove)
+            kept = [row for y, row in enumerate(self.grid) if y not in removed]
+            self.grid = [[0] * self.width for _ in range(lines_cleared)] + kept
+            self.profile.remove_rows(removed, self.is_filled)
+            self.shift_board(rows_to_remove)
 
             # Обновление счета и уровня
             self.score += [40, 100, 300, 1200][lines_cleared - 1] * self.level
             self.level = 1 + self.score // 1000
-            global fall_speed
-            fall_speed = max(100, 1000 - (self.level - 1) * 100)
-            # Отладочный вывод сетки
-            # print("Сетка после удаления строк:")
-            # for row in self.grid:
-            #     print(row)
+            self.fall_speed = fall_speed_for_level(self.level)
+
+    # Слой поля после очистки строк: все, что выше каждой серии удаленных строк, сдвигается вниз
+    # одним scroll, сверху закрашиваются только освободившиеся строки
+    def shift_board(self, rows_to_remove):
+        self.board_version += 1
+        if self.board_surface is None:
+            return
+        size = self.block_size
+        width = self.width * size
+        runs = []
+        for y in rows_to_remove:
+            if runs and runs[-1][1] == y - 1:
+                runs[-1][1] = y
+            else:
+                runs.append([y, y])
+        # Серии идут сверху вниз: сдвиг верхней серии не меняет номера строк нижних
+        for first, last in runs:
+            area = self.board_surface.subsurface((0, 0, width, (last + 1) * size))
+            area.scroll(0, (last - first + 1) * size)
+        self.board_surface.fill(BLACK, (0, 0, width, len(rows_to_remove) * size))
+
+    # Слой с уже упавшими блоками перерисовывается только при изменении поля
+    def render_board(self):
+        self.board_version += 1
+        self.board_stale = False
+        if self.board_surface is None:
+            return
+        self.board_surface.fill(BLACK)
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.grid[y][x]:
+                    self.paint_cell(x, y)
+
+    def paint_cell(self, x, y):
+        self.board_version += 1
+        if self.board_surface is None:
+            return
+        self.board_surface.blit(
+            get_block_surface(color=self.grid[y][x], size=self.block_size),
+            (x * self.block_size, y * self.block_size)
+        )
+
+    # Мусорные строки от соперника поднимают поле снизу, в каждой строке одна дыра
+    def add_garbage(self, count):
+        count = min(count, self.height)
+        if any(any(row) for row in self.grid[:count]):
+            self.game_over = True
+        garbage = []
+        for _ in range(count):
+            row = [GARBAGE_COLOR] * self.width
+            row[self.rng.randrange(self.width)] = 0
+            garbage.append(row)
+        self.grid = self.grid[count:] + garbage
+        if self.current_piece and self.check_collision(
+                self.current_piece['shape'], (self.current_piece['x'], self.current_piece['y'])):
+            self.current_piece['y'] -= count
+        self.profile.rescan_all(self.is_filled)
+        self.render_board()
+
+    def piece_surface(self):
+        return get_block_surface(color=self.current_piece['color'], size=self.block_size)
+
+    # Снимок состояния без поверхностей
+    def snapshot(self):
+        return BoardSnapshot(
+            tuple(tuple(row) for row in self.grid),
+            self.score,
+            self.level,
+            freeze_piece(self.current_piece),
+            self.next_piece,
+            lines=self.lines,
+            game_over=self.game_over,
+            fall_time=self.fall_time,
+            rng_state=self.rng.getstate(),
+            profile=self.profile.state()
+        )
+
+    # render=False для перебора ходов: слой поля не трогается и перерисуется при следующем показе
+    def restore(self, snapshot, render=True):
+        self.grid = [list(row) for row in snapshot.rows]
+        self.score = snapshot.score
+        self.level = snapshot.level
+        self.lines = snapshot.lines
+        self.fall_speed = fall_speed_for_level(self.level)
+        self.fall_time = snapshot.fall_time
+        self.current_piece = thaw_piece(snapshot.current_piece)
+        self.next_piece = snapshot.next_piece
+        self.game_over = snapshot.game_over
+        if snapshot.rng_state is not None:
+            self.rng.setstate(snapshot.rng_state)
+        self.explosions.empty()
+        if snapshot.profile is not None:
+            self.profile.load(snapshot.profile)
+        else:
+            self.profile.rescan_all(self.is_filled)
+        if render:
+            self.render_board()
+        else:
+            self.board_version += 1
+            self.board_stale = True
 
     def draw(self, screen):
         screen.fill(BLACK)
         self.draw_border(screen)
-
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.grid[y][x]:
-                    pygame.draw.rect(screen, self.grid[y][x], (
-                        GRID_OFFSET_X + x * BLOCK_SIZE,
-                        GRID_OFFSET_Y + y * BLOCK_SIZE,
-                        BLOCK_SIZE - 1,
-                        BLOCK_SIZE - 1
-                    ))
+        self.scroll_row = self.board.scroll_for(self.current_piece)
+        draw_board_view(screen, self)
 
         if self.current_piece:
-            shape = self.current_piece['shape']
-            for y, row in enumerate(shape):
-                for x, cell in enumerate(row):
-                    if cell:
-                        pygame.draw.rect(screen, self.current_piece['color'], (
-                            GRID_OFFSET_X + (self.current_piece['x'] + x) * BLOCK_SIZE,
-                            GRID_OFFSET_Y + (self.current_piece['y'] + y) * BLOCK_SIZE,
-                            BLOCK_SIZE - 1,
-                            BLOCK_SIZE - 1
-                        ))
+            draw_ghost(screen, self)
+            draw_piece(screen, self)
 
-        self.all_sprites.draw(screen)
-        self.explosions.draw(screen)
+        draw_explosions(screen, self)
         self.draw_next_piece(screen)
         self.draw_score_and_level(screen)
 
 
 class TetrisMath:
-    def __init__(self, custom_examples=None, explosion_threshold=1000):
+    def __init__(self, custom_examples=None, explosion_threshold=1000, board=None, headless=False,
+                 generator=None, seed=None):
+        self.board = board or DEFAULT_BOARD
+        # Свой генератор случайных чисел: с одинаковым seed партия повторяется
+        self.rng = random.Random(seed)
+        self.generator = generator
+        self.headless = headless
+        self.width = self.board.width
+        self.height = self.board.height
+        self.block_size = self.board.block_size
         self.explosion_threshold = explosion_threshold
-        self.cube_texture = pygame.image.load("Sprites/cube.png").convert_alpha()
-        self.cube_texture = pygame.transform.scale(self.cube_texture, (BLOCK_SIZE, BLOCK_SIZE))
-        self.grid = [[{'texture': None, 'value': None} for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
+        self.cube_texture = load_texture("Sprites/cube.png", (self.block_size, self.block_size))
+        # Поле хранится как битовая карта занятости и плоский массив значений, текстура всегда cube_texture
+        self.occupied = bytearray((self.width * self.height + 7) // 8)
+        self.values = array('i', [0]) * (self.width * self.height)
         self.score = 0
         self.level = 1
+        self.exploded = 0
         self.current_piece = None
         self.game_over = False
-        self.all_sprites = pygame.sprite.Group()
-        self.explosions = pygame.sprite.Group()
+        # Часы симуляции и падение фигуры, см. step_game
+        self.sim_time = 0
+        self.fall_time = 0
+        self.fall_speed = fall_speed_for_level(self.level)
+        self.last_piece_y = None
+        self.piece_draw_y = None
+        self.explosions = ExplosionPool(clock=lambda: self.sim_time)
         self.paused = False
         self.piece_count = 0
-        self.examples_dict = {}
-        self.load_examples("data/examples.txt", custom_examples)
+        self.scroll_row = 0
+        self.board_version = 0
+        self.board_stale = False
+        self.profile = ColumnProfile(self.width, self.height)
+        self.board_surface = None
+        if not headless:
+            self.board_surface = pygame.Surface((self.width * self.block_size, self.height * self.block_size))
+            self.board_surface.fill(BLACK)
+        # Учет блоков без полного обхода поля
+        self.value_counts = Counter()
+        self.dirty_columns = set()
+        self.touched_cells = set()
+        self.examples_dict = ExampleIndex()
+        # С генератором примеры создаются на лету, файл не нужен
+        if generator is None:
+            self.load_examples("data/examples.txt", custom_examples)
         self.add_initial_blocks() #добавил 10 случайных кубиков, иначе в начале совсем скучно
         self.new_piece()
 
@@ -350,25 +989,61 @@ class TetrisMath:
     def add_initial_blocks(self):
         for _ in range(10):
             while True:
-                x = random.randint(0, GRID_WIDTH - 1)
-                y = random.randint(GRID_HEIGHT // 2, GRID_HEIGHT - 1)  # Спавн в нижней половине
-                if self.grid[y][x]['value'] is None:
-                    value = random.randint(1, self.explosion_threshold - 1)
-                    self.grid[y][x] = {
-                        'texture': self.cube_texture,
-                        'value': value
-                    }
-                    block = Block(
-                        image=self.cube_texture,
-                        x=GRID_OFFSET_X + x * BLOCK_SIZE,
-                        y=GRID_OFFSET_Y + y * BLOCK_SIZE,
-                        value=value
-                    )
-                    self.all_sprites.add(block)
+                x = self.rng.randint(0, self.width - 1)
+                y = self.rng.randint(self.height // 2, self.height - 1)  # Спавн в нижней половине
+                if not self.is_filled(x, y):
+                    value = self.rng.randint(1, self.explosion_threshold - 1)
+                    self.set_cell(x, y, value)
                     break
 
+    # Запись и очистка клеток поддерживают профиль, слой поля и счетчики значений
+    def set_cell(self, x, y, value):
+        old = self.cell_value(x, y)
+        if old is not None:
+            self.forget_value(old)
+        else:
+            self.profile.fill(x, y)
+        i = y * self.width + x
+        self.occupied[i >> 3] |= 1 << (i & 7)
+        self.values[i] = value
+        self.value_counts[value] += 1
+        self.dirty_columns.add(x)
+        self.touched_cells.add((x, y))
+        self.paint_cell(x, y)
+
+    def clear_cell(self, x, y):
+        old = self.cell_value(x, y)
+        if old is not None:
+            self.forget_value(old)
+        i = y * self.width + x
+        self.occupied[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+        self.values[i] = 0
+        if old is not None:
+            self.profile.clear(x, y, self.is_filled)
+        self.paint_cell(x, y)
+
+    def forget_value(self, value):
+        self.value_counts[value] -= 1
+        if not self.value_counts[value]:
+            del self.value_counts[value]
+
+    def paint_cell(self, x, y):
+        self.board_version += 1
+        if self.board_surface is None:
+            return
+        value = self.cell_value(x, y)
+        position = (x * self.block_size, y * self.block_size)
+        if value is not None:
+            self.board_surface.blit(
+                get_block_surface(image=self.cube_texture, value=value, size=self.block_size), position)
+        else:
+            self.board_surface.fill(BLACK, (position, (self.block_size, self.block_size)))
+
+    def piece_surface(self):
+        return self.current_piece['texture']
+
     def draw_score_and_level(self, screen):
-        font = pygame.font.Font(None, 36)
+        font = get_font(36)
         score_text = font.render(f"Счет: {self.score}", True, WHITE)
         level_text = font.render(f"Уровень: {self.level}", True, WHITE)
         screen.blit(score_text, (SCREEN_WIDTH - 150, 200))
@@ -378,6 +1053,41 @@ class TetrisMath:
         if not self.move(0, 1):
             self.lock_piece()
 
+    # Доступ к клеткам: бит занятости отделен от значения, потому что 0 тоже допустимый ответ
+    def is_filled(self, x, y):
+        i = y * self.width + x
+        return bool(self.occupied[i >> 3] & (1 << (i & 7)))
+
+    def cell_value(self, x, y):
+        i = y * self.width + x
+        if self.occupied[i >> 3] & (1 << (i & 7)):
+            return self.values[i]
+        return None
+
+    def filled_cells(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.is_filled(x, y):
+                    yield x, y, self.values[y * self.width + x]
+
+    # Ключ состояния поля для сравнения и хеширования: два плоских буфера, без обхода клеток
+    def board_key(self):
+        return bytes(self.occupied) + self.values.tobytes()
+
+    # Расстояние до точки падения: по профилю столбцов, а под нависающими блоками пошагово
+    def drop_distance(self):
+        piece = self.current_piece
+        distance = self.profile.drop_distance(piece['shape'], piece['x'], piece['y'])
+        if distance is None:
+            distance = 0
+            while not self.check_collision(piece['shape'], (piece['x'], piece['y'] + distance + 1)):
+                distance += 1
+        return distance
+
+    def hard_drop(self):
+        self.current_piece['y'] += self.drop_distance()
+        self.lock_piece()
+
     def move(self, dx, dy):
         new_x = self.current_piece['x'] + dx
         new_y = self.current_piece['y'] + dy
@@ -394,33 +1104,31 @@ class TetrisMath:
             self.current_piece['shape'] = rotated
 
     def load_examples(self, default_path, custom_examples=None):
-        self.examples_dict = {}
+        # Уже разобранные примеры (меню "Загрузить примеры") используются как есть
+        if isinstance(custom_examples, dict):
+            if not isinstance(custom_examples, ExampleIndex):
+                custom_examples = ExampleIndex(custom_examples)
+            self.examples_dict = custom_examples
+            return
         if custom_examples is not None:
             # Загружаем только пользовательские примеры, если они есть
-            for example_line in custom_examples:
-                example_line = example_line.strip()
-                if '=' in example_line:
-                    example, answer = example_line.split('=', 1)
-                    example = example.strip()
-                    try:
-                        self.examples_dict[example] = int(answer.strip())
-                    except ValueError:
-                        print(f"Некорректный ответ в примере: {example_line}")
-        else:
-            # Загружаем примеры из файла по умолчанию
-            try:
-                with open(default_path, "r", encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if '=' in line:
-                            example, answer = line.split('=', 1)
-                            example = example.strip()
-                            try:
-                                self.examples_dict[example] = int(answer.strip())
-                            except ValueError:
-                                print(f"Некорректный ответ в примере: {line}")
-            except FileNotFoundError:
-                print(f"Файл {default_path} не найден!")
+            self.examples_dict, report = parse_example_lines(custom_examples)
+            if report.errors:
+                print(report.summary())
+            return
+        # Файл по умолчанию читается один раз на процесс, словарь общий для всех игр
+        if default_path in _examples_cache:
+            self.examples_dict = _examples_cache[default_path]
+            return
+        # Загружаем примеры из файла по умолчанию
+        try:
+            self.examples_dict, report = parse_examples_file(default_path)
+            if report.errors:
+                print(report.summary())
+            _examples_cache[default_path] = self.examples_dict
+        except FileNotFoundError:
+            self.examples_dict = ExampleIndex()
+            print(f"Файл {default_path} не найден!")
     def lock_piece(self):
         shape = self.current_piece['shape']
         for y, row in enumerate(shape):
@@ -431,136 +1139,211 @@ class TetrisMath:
                     if gy < 0:
                         self.game_over = True
                         return
-                    self.grid[gy][gx] = {
-                        'texture': self.cube_texture,
-                        'value': self.current_piece['answer']
-                    }
-                    block = Block(
-                        image=self.cube_texture,
-                        x=GRID_OFFSET_X + gx * BLOCK_SIZE,
-                        y=GRID_OFFSET_Y + gy * BLOCK_SIZE,
-                        value=self.current_piece['answer']
-                    )
-                    self.all_sprites.add(block)
+                    self.set_cell(gx, gy, self.current_piece['answer'])
+        self.piece_count += 1
 
         self.check_merge()
         self.check_explosions()
         self.new_piece()
 
+    # Взорваться могут только клетки, записанные после прошлой проверки
     def check_explosions(self):
         explosions_to_create = []
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.grid[y][x]['value'] and self.grid[y][x]['value'] >= self.explosion_threshold:
-                    explosions_to_create.append((x, y))
-                    self.grid[y][x] = {'texture': None, 'value': None}
-                    self.score += 1000
-        for block in self.all_sprites.sprites():
-            grid_x = (block.rect.x - GRID_OFFSET_X) // BLOCK_SIZE
-            grid_y = (block.rect.y - GRID_OFFSET_Y) // BLOCK_SIZE
-            if (grid_x, grid_y) in explosions_to_create:
-                block.kill()
-        for x, y in explosions_to_create:
-            self.create_explosion(x, y)
-        self.all_sprites.empty()
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.grid[y][x]['value'] is not None:
-                    block = Block(
-                        image=self.cube_texture,
-                        x=GRID_OFFSET_X + x * BLOCK_SIZE,
-                        y=GRID_OFFSET_Y + y * BLOCK_SIZE,
-                        value=self.grid[y][x]['value']
-                    )
-                    self.all_sprites.add(block)
-        self.all_sprites.empty()
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.grid[y][x]['value'] is not None:
-                    block = Block(
-                        image=self.cube_texture,
-                        x=GRID_OFFSET_X + x * BLOCK_SIZE,
-                        y=GRID_OFFSET_Y + y * BLOCK_SIZE,
-                        value=self.grid[y][x]['value']
-                    )
-                    self.all_sprites.add(block)
-
-    def create_explosion(self, x, y):
+        for x, y in sorted(self.touched_cells, key=lambda cell: (cell[1], cell[0])):
+            value = self.cell_value(x, y)
+            if value and value >= self.explosion_threshold:
+                explosions_to_create.append((x, y))
+                self.clear_cell(x, y)
+                self.score += 1000
+        self.touched_cells.clear()
+        self.exploded += len(explosions_to_create)
+        # Звук один на всю пачку взрывов
+        for i, (x, y) in enumerate(explosions_to_create):
+            self.create_explosion(x, y, sound=i == 0)
+
+    # Снимок состояния: в строках хранятся только значения, текстура подразумевается
+    def snapshot(self):
+        return BoardSnapshot(
+            None,
+            self.score,
+            self.level,
+            freeze_piece(self.current_piece),
+            piece_count=self.piece_count,
+            exploded=self.exploded,
+            game_over=self.game_over,
+            fall_time=self.fall_time,
+            rng_state=self.rng_state(),
+            profile=self.profile.state(),
+            cells=self.board_key(),
+            size=(self.width, self.height),
+            value_counts=tuple(self.value_counts.items())
+        )
+
+    # Состояние своего генератора и генератора примеров, если он есть
+    def rng_state(self):
+        generator_rng = getattr(self.generator, 'rng', None)
+        return self.rng.getstate(), generator_rng.getstate() if generator_rng is not None else None
+
+    def set_rng_state(self, state):
+        own, generator = state
+        self.rng.setstate(own)
+        if generator is not None:
+            self.generator.rng.setstate(generator)
+
+    # render=False для перебора ходов: слой поля не трогается и перерисуется при следующем показе
+    def restore(self, snapshot, render=True):
+        if snapshot.cells is not None:
+            size = len(self.occupied)
+            self.occupied = bytearray(snapshot.cells[:size])
+            self.values = array('i')
+            self.values.frombytes(snapshot.cells[size:])
+        else:
+            self.occupied = bytearray(len(self.occupied))
+            self.values = array('i', [0]) * (self.width * self.height)
+            for y, row in enumerate(snapshot.rows):
+                for x, value in enumerate(row):
+                    if value is not None:
+                        i = y * self.width + x
+                        self.occupied[i >> 3] |= 1 << (i & 7)
+                        self.values[i] = value
+        self.score = snapshot.score
+        self.level = snapshot.level
+        self.fall_speed = fall_speed_for_level(self.level)
+        self.current_piece = thaw_piece(snapshot.current_piece)
+        self.piece_count = snapshot.piece_count
+        self.exploded = snapshot.exploded
+        self.fall_time = snapshot.fall_time
+        self.game_over = snapshot.game_over
+        if snapshot.rng_state is not None:
+            self.set_rng_state(snapshot.rng_state)
+        self.explosions.empty()
+        self.refresh_board(snapshot.profile, snapshot.value_counts, render)
+
+    # Пересчет счетчиков, профиля и слоя после замены всего поля.
+    # Готовые профиль и счетчики из снимка берутся как есть, без обхода клеток
+    def refresh_board(self, profile=None, value_counts=None, render=True):
+        if value_counts is not None:
+            self.value_counts = Counter(dict(value_counts))
+        else:
+            self.value_counts = Counter(value for _, _, value in self.filled_cells())
+        self.dirty_columns = set(range(self.width))
+        self.touched_cells = set()
+        if profile is not None:
+            self.profile.load(profile)
+        else:
+            self.profile.rescan_all(self.is_filled)
+        if render:
+            self.render_board()
+        else:
+            self.board_version += 1
+            self.board_stale = True
+
+    def render_board(self):
+        self.board_version += 1
+        self.board_stale = False
+        if self.board_surface is None:
+            return
+        self.board_surface.fill(BLACK)
+        for x, y, _ in self.filled_cells():
+            self.paint_cell(x, y)
+
+    # Мусор от соперника: снизу добавляются строки случайных кубиков с одной дырой
+    def add_garbage(self, count):
+        count = min(count, self.height)
+        if any(self.is_filled(x, y) for y in range(count) for x in range(self.width)):
+            self.game_over = True
+        # Сдвиг вверх на count строк: значения срезом массива, занятость сдвигом битов
+        shift = count * self.width
+        bits = int.from_bytes(self.occupied, 'little') >> shift
+        values = self.values[shift:] + array('i', [0]) * shift
+        for y in range(self.height - count, self.height):
+            hole = self.rng.randrange(self.width)
+            for x in range(self.width):
+                if x != hole:
+                    i = y * self.width + x
+                    bits |= 1 << i
+                    values[i] = self.rng.randint(1, self.explosion_threshold - 1)
+        self.occupied = bytearray(bits.to_bytes(len(self.occupied), 'little'))
+        self.values = values
+        if self.current_piece and self.check_collision(
+                self.current_piece['shape'], (self.current_piece['x'], self.current_piece['y'])):
+            self.current_piece['y'] -= count
+        self.refresh_board()
+
+    def create_explosion(self, x, y, sound=True):
+        if self.headless:
+            return
         # Рассчет координат
-        screen_x = GRID_OFFSET_X + x * BLOCK_SIZE + BLOCK_SIZE // 2
-        screen_y = GRID_OFFSET_Y + y * BLOCK_SIZE + BLOCK_SIZE // 2
+        screen_x = x * self.block_size + self.block_size // 2
+        screen_y = y * self.block_size + self.block_size // 2
 
-        explosion = Explosion(screen_x, screen_y)
-        self.explosions.add(explosion)
-        explosion_sound.play()
+        self.explosions.spawn(screen_x, screen_y)
+        if sound:
+            explosion_sound.play()
 
 
     #Подсчет кубиков на поле.
     def count_blocks(self):
-        count = 0
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.grid[y][x]['value'] is not None:
-                    count += 1
-        return count
+        return sum(self.value_counts.values())
 
+    # Слияния идут только по вертикали, поэтому проверяются лишь измененные столбцы.
+    # Столбец, в котором произошло слияние, остается помеченным до следующей проверки.
     def check_merge(self):
         merged = False
-        for y in range(GRID_HEIGHT - 1, 0, -1):
-            for x in range(GRID_WIDTH):
-                current = self.grid[y][x]
-                below = self.grid[y - 1][x]
-
-                if current['value'] and current['value'] == below['value']:
+        columns = sorted(self.dirty_columns)
+        self.dirty_columns = set()
+        for y in range(self.height - 1, 0, -1):
+            for x in columns:
+                current = self.cell_value(x, y)
+                below = self.cell_value(x, y - 1)
+
+                if current and current == below:
                     #взрыв нижнего кубика. Не уверен что надо
                     self.create_explosion(x, y - 1)
 
-                    new_value = current['value'] + below['value']
-                    self.grid[y][x]['value'] = new_value
-                    self.grid[y - 1][x] = {'texture': None, 'value': None}
-
-                    for block in self.all_sprites:
-                        if block.rect.collidepoint(
-                                GRID_OFFSET_X + x * BLOCK_SIZE,
-                                GRID_OFFSET_Y + (y - 1) * BLOCK_SIZE
-                        ):
-                            block.kill()
+                    new_value = current + below
+                    self.set_cell(x, y, new_value)
+                    self.clear_cell(x, y - 1)
                     merged = True
 
-    def new_piece(self):
-        existing_values = []
+    # Сложность примеров генератора по числу упавших фигур
+    def example_level(self):
+        return max(self.level, 1 + self.piece_count // EXAMPLE_LEVEL_PIECES)
 
+    def new_piece(self):
         # Собираем значение кубиков
         if self.count_blocks() >= 10:
-            for y in range(GRID_HEIGHT):
-                for x in range(GRID_WIDTH):
-                    value = self.grid[y][x].get('value')
-                    if value is not None:
-                        existing_values.append(value)
-
-
-            unique_values = list(set(existing_values))
+            unique_values = sorted(self.value_counts)
             if unique_values:
                 # Случайное значение из собранных
-                target = random.choice(unique_values)
-
-                possible_examples = [ex for ex, ans in self.examples_dict.items() if ans == target]
-                example = random.choice(possible_examples)
-                answer = self.examples_dict[example]
+                target = self.rng.choice(unique_values)
 
-                self.current_piece = {
-                    'shape': [[1]],
-                    'texture': self.cube_texture,
-                    'x': GRID_WIDTH // 2,
-                    'y': 0,
-                    'example': example,
-                    'answer': answer
-                }
-                return
+                if self.generator is not None:
+                    example, answer = self.generator.example_for(target, self.example_level())
+                else:
+                    # Примеры с нужным ответом берутся из индекса, без обхода словаря
+                    possible_examples = self.examples_dict.with_answer(target)
+                    # Если среди примеров нет нужного ответа, берется случайный пример
+                    example = self.rng.choice(possible_examples) if possible_examples else None
+                    answer = self.examples_dict.get(example)
+
+                if example is not None:
+                    self.current_piece = {
+                        'shape': [[1]],
+                        'texture': self.cube_texture,
+                        'x': self.width // 2,
+                        'y': 0,
+                        'example': example,
+                        'answer': answer
+                    }
+                    return
 
 
-        if self.examples_dict:
-            example, answer = random.choice(list(self.examples_dict.items()))
+        if self.generator is not None:
+            example, answer = self.generator.random_example(self.example_level(), self.explosion_threshold - 1)
+        elif self.examples_dict:
+            example = self.rng.choice(self.examples_dict.order)
+            answer = self.examples_dict[example]
         else:
             example = "0 + 0"
             answer = 0
@@ -568,7 +1351,7 @@ class TetrisMath:
         self.current_piece = {
             'shape': [[1]],
             'texture': self.cube_texture,
-            'x': GRID_WIDTH // 2,
+            'x': self.width // 2,
             'y': 0,
             'example': example,
             'answer': answer
@@ -582,11 +1365,11 @@ class TetrisMath:
         for y, row in enumerate(shape):
             for x, cell in enumerate(row):
                 if cell:
-                    if x + dx < 0 or x + dx >= GRID_WIDTH:
+                    if x + dx < 0 or x + dx >= self.width:
                         return True
-                    if y + dy >= GRID_HEIGHT:
+                    if y + dy >= self.height:
                         return True
-                    if y + dy >= 0 and self.grid[y + dy][x + dx]['texture']:
+                    if y + dy >= 0 and self.is_filled(x + dx, y + dy):
                         return True
         return False
 
@@ -594,36 +1377,15 @@ class TetrisMath:
     def draw(self, screen):
         screen.fill(BLACK)
         self.draw_border(screen)
+        self.scroll_row = self.board.scroll_for(self.current_piece)
+        draw_board_view(screen, self)
         if self.current_piece and not self.game_over:
-            piece = self.current_piece
-            for y, row in enumerate(piece['shape']):
-                for x, cell in enumerate(row):
-                    if cell:
-                        screen.blit(piece['texture'], (
-                            GRID_OFFSET_X + (piece['x'] + x) * BLOCK_SIZE,
-                            GRID_OFFSET_Y + (piece['y'] + y) * BLOCK_SIZE
-                        ))
+            draw_ghost(screen, self)
+            draw_piece(screen, self)
 
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                cell = self.grid[y][x]
-                if cell['texture']:
-                    screen.blit(cell['texture'], (
-                        GRID_OFFSET_X + x * BLOCK_SIZE,
-                        GRID_OFFSET_Y + y * BLOCK_SIZE
-                    ))
-                    if cell['value'] is not None:
-                        font = pygame.font.Font(None, 24)
-                        text = font.render(str(cell['value']), True, WHITE)
-                        text_rect = text.get_rect(
-                            center=(GRID_OFFSET_X + x * BLOCK_SIZE + BLOCK_SIZE // 2,
-                                    GRID_OFFSET_Y + y * BLOCK_SIZE + BLOCK_SIZE // 2)
-                        )
-                        screen.blit(text, text_rect)
-
-        self.explosions.draw(screen)
-
-        font = pygame.font.Font(None, 36)
+        draw_explosions(screen, self)
+
+        font = get_font(36)
         if self.current_piece:
             example_text = font.render(f"Пример: {self.current_piece['example']}", True, WHITE)
             screen.blit(example_text, (20, 20))
@@ -632,13 +1394,131 @@ class TetrisMath:
 
     def draw_border(self, screen):
         pygame.draw.rect(screen, WHITE, (
-            GRID_OFFSET_X - 2,
-            GRID_OFFSET_Y - 2,
-            GRID_WIDTH * BLOCK_SIZE + 4,
-            GRID_HEIGHT * BLOCK_SIZE + 4
+            self.board.offset_x - 2,
+            self.board.offset_y - 2,
+            self.width * self.block_size + 4,
+            self.board.visible_rows * self.block_size + 4
         ), 2)
 
 
+# Управление для локальных игроков в режиме нескольких полей: влево, вправо, поворот, вниз
+PLAYER_KEYMAPS = [
+    (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN),
+    (pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s)
+]
+
+
+# Несколько независимых игр на одном экране: первые поля у локальных игроков, остальные у ботов.
+# Каждое поле рисуется в свою подповерхность, и перерисовываются только изменившиеся поля,
+# поэтому на экран за кадр уходит один display.update со списком грязных прямоугольников.
+class MultiBoard:
+    def __init__(self, count=16, players=2, columns=4, make_game=None):
+        rows = (count + columns - 1) // columns
+        tile_width = SCREEN_WIDTH // columns
+        tile_height = SCREEN_HEIGHT // rows
+        board = BoardSettings(
+            f"{GRID_WIDTH}x{GRID_HEIGHT}", GRID_WIDTH, GRID_HEIGHT,
+            view_size=(tile_width - 8, tile_height - 28),
+            surface_size=(tile_width, tile_height),
+            bottom_margin=4
+        )
+        make_game = make_game or (lambda settings: Tetris(board=settings))
+        self.games = [make_game(board) for _ in range(count)]
+        self.tiles = [
+            pygame.Rect((i % columns) * tile_width, (i // columns) * tile_height, tile_width, tile_height)
+            for i in range(count)
+        ]
+        self.keymaps = PLAYER_KEYMAPS[:min(players, len(PLAYER_KEYMAPS))]
+        self.clock = SimulationClock()
+        self.signatures = [None] * count
+        self.bot_plans = [None] * count
+        self.paused = False
+
+    def handle_input(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_SPACE:
+            self.paused = not self.paused
+            return
+        for game, (left, right, rotate, down) in zip(self.games, self.keymaps):
+            if game.game_over:
+                continue
+            if event.key == left:
+                game.move(-1, 0)
+            elif event.key == right:
+                game.move(1, 0)
+            elif event.key == rotate:
+                game.rotate()
+            elif event.key == down:
+                game.drop()
+
+    # Бот выбирает для каждой новой фигуры случайный столбец и поворот, затем ведет ее туда
+    def bot_step(self, index, game):
+        piece = game.current_piece
+        plan = self.bot_plans[index]
+        if plan is None or plan[0] is not piece:
+            plan = [piece, random.randrange(game.width), random.randrange(4)]
+            self.bot_plans[index] = plan
+        if plan[2]:
+            game.rotate()
+            plan[2] -= 1
+        elif piece['x'] < plan[1] and game.move(1, 0):
+            pass
+        elif piece['x'] > plan[1] and game.move(-1, 0):
+            pass
+        else:
+            game.drop()
+
+    def update(self, delta_time):
+        if self.paused:
+            return
+        ticks = self.clock.advance(delta_time)
+        players = len(self.keymaps)
+        for i, game in enumerate(self.games):
+            if game.game_over:
+                continue
+            if i >= players:
+                self.bot_step(i, game)
+            for _ in range(ticks):
+                step_game(game, self.clock.tick_ms)
+            interpolate_game(game, self.clock.alpha)
+
+    @property
+    def finished(self):
+        return all(game.game_over for game in self.games)
+
+    def draw(self, screen):
+        dirty = []
+        for i, (game, tile) in enumerate(zip(self.games, self.tiles)):
+            piece = game.current_piece
+            signature = (
+                game.board_version, game.score, game.game_over,
+                piece and (piece['x'], piece['y'], piece['shape']), game.piece_draw_y
+            )
+            if signature == self.signatures[i] and not game.explosions:
+                continue
+            self.signatures[i] = signature
+            surface = screen.subsurface(tile)
+            surface.fill(BLACK)
+            self.draw_tile(surface, game, i)
+            dirty.append(tile)
+        return dirty
+
+    def draw_tile(self, surface, game, index):
+        game.draw_border(surface)
+        game.scroll_row = game.board.scroll_for(game.current_piece)
+        draw_board_view(surface, game)
+        if game.current_piece and not game.game_over:
+            draw_ghost(surface, game)
+            draw_piece(surface, game)
+        draw_explosions(surface, game)
+        label = f"Игрок {index + 1}" if index < len(self.keymaps) else f"Бот {index + 1}"
+        surface.blit(render_text(f"{label}: {game.score}", 20), (4, 4))
+        if game.game_over:
+            text = render_text("Game Over", 28)
+            surface.blit(text, (surface.get_width() // 2 - text.get_width() // 2, surface.get_height() // 2))
+
+
 class GameModeSelection:
     def __init__(self):
         self.font = pygame.font.Font(None, 74)
@@ -648,10 +1528,13 @@ class GameModeSelection:
             "Загрузить примеры",
             "Таблица рекордов",
             "Выход",
-            "Порог взрыва (текущий: 1000)"
+            "Порог взрыва (текущий: 1000)",
+            f"Размер поля (текущий: {DEFAULT_BOARD.name})",
+            "Несколько полей"
         ]
         self.selected = 0
         self.explosion_threshold = 1000
+        self.board = DEFAULT_BOARD
 
     def draw(self, screen):
         screen.fill(BLACK)
@@ -659,10 +1542,10 @@ class GameModeSelection:
             color = WHITE if i == self.selected else (128, 128, 128)
             text = self.font.render(option, True, color)
             screen.blit(text, (SCREEN_WIDTH//2 - text.get_width()//2,
-                            SCREEN_HEIGHT//2 - 150 + i*75))
+                            SCREEN_HEIGHT//2 - 250 + i*75))
             #Уведомление о загрузке
             if hasattr(self, 'loaded_status'):
-                status_font = pygame.font.Font(None, 36)
+                status_font = get_font(36)
                 status_text = status_font.render(self.loaded_status, True, WHITE)
                 screen.blit(status_text, (20, SCREEN_HEIGHT - 50))
 
@@ -714,6 +1597,38 @@ class ThresholdSelection:
                     return int(self.options[self.selected])
         return None
 
+# Выбор размера поля
+class BoardSelection:
+    def __init__(self, current_board):
+        self.font = pygame.font.Font(None, 74)
+        self.options = [board.name for board in BOARD_PRESETS] + ["Назад"]
+        self.selected = 0
+        self.current_board = current_board
+
+    def draw(self, screen):
+        screen.fill(BLACK)
+        title = self.font.render("Выберите размер поля", True, WHITE)
+        screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 100))
+
+        for i, option in enumerate(self.options):
+            color = WHITE if i == self.selected else (128, 128, 128)
+            text = self.font.render(option, True, color)
+            screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2,
+                               200 + i * 100))
+
+    def handle_input(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_UP:
+                self.selected = (self.selected - 1) % len(self.options)
+            if event.key == pygame.K_DOWN:
+                self.selected = (self.selected + 1) % len(self.options)
+            if event.key == pygame.K_RETURN:
+                if self.selected == len(BOARD_PRESETS):  # Назад
+                    return False
+                else:
+                    return BOARD_PRESETS[self.selected]
+        return None
+
 # Ввод имени.
 
 class NameInputScreen:
@@ -782,11 +1697,7 @@ class HighScoresScreen:
         screen.blit(title_text, (SCREEN_WIDTH // 2 - title_text.get_width() // 2, 50))
 
         # База данных
-        conn = sqlite3.connect("data/tetris_scores.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT player_name, score, level, date FROM scores ORDER BY score DESC LIMIT 10")
-        scores = cursor.fetchall()
-        conn.close()
+        scores = top_scores(10)
 
         # отображение таблицы лидеров
         y_offset = 150
@@ -812,6 +1723,17 @@ class HighScoresScreen:
         return None
 
 
+# Новая партия выбранного в меню режима: 0 - классический Тетрис, 1 - Тетрис с примерами
+def create_game(selected, mode_selection, custom_examples):
+    if selected == 0:
+        return Tetris(board=mode_selection.board)
+    # Без загруженного файла примеры создает генератор
+    return TetrisMath(
+        custom_examples=custom_examples, explosion_threshold=mode_selection.explosion_threshold,
+        board=mode_selection.board,
+        generator=ExampleGenerator() if custom_examples is None else None)
+
+
 def main():
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption("Тетрис")
@@ -820,6 +1742,11 @@ def main():
 
     custom_examples = None
 
+    # Замеры памяти только по флагу --memtrack
+    memory = MemoryTracker() if memtrack_enabled() else None
+    # Телеметрия сессий пишется в data/telemetry.db фоновым потоком, отключается флагом --no-telemetry
+    telemetry = Telemetry() if telemetry_enabled() else None
+
     # Инициализация базы данных
     init_db()
 
@@ -843,9 +1770,12 @@ def main():
 
                 if file_path:
                     try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            custom_examples = [line.strip() for line in f if line.strip()]
-                    except Exception as e:
+                        custom_examples, report = parse_examples_file(file_path, check_answers=True)
+                        mode_selection.loaded_status = (
+                            f"Загружено примеров: {report.accepted}, ошибок: {report.errors}")
+                        if report.errors:
+                            print(report.summary())
+                    except (OSError, UnicodeDecodeError) as e:
                         print(f"Ошибка загрузки файла: {e}")
                 continue
             if selected == 5:  # Пункт "Порог взрыва"
@@ -856,7 +1786,7 @@ def main():
                         if result is not None:
                             if isinstance(result, int):
                                 mode_selection.explosion_threshold = result
-                                mode_selection.options[3] = f"Порог взрыва (текущий: {result})"
+                                mode_selection.options[5] = f"Порог взрыва (текущий: {result})"
                             break
                     else:
                         threshold_menu.draw(screen)
@@ -865,12 +1795,41 @@ def main():
                         continue
                     break
                 continue
+            if selected == 6:  # Пункт "Размер поля"
+                board_menu = BoardSelection(mode_selection.board)
+                while True:
+                    for e in pygame.event.get():
+                        result = board_menu.handle_input(e)
+                        if result is not None:
+                            if result:
+                                mode_selection.board = result
+                                mode_selection.options[6] = f"Размер поля (текущий: {result.name})"
+                            break
+                    else:
+                        board_menu.draw(screen)
+                        pygame.display.flip()
+                        clock.tick(60)
+                        continue
+                    break
+                continue
+            if selected == 7:  # Несколько полей: выход в меню по Esc
+                multi_board = MultiBoard()
+                screen.fill(BLACK)
+                pygame.display.flip()
+                running = True
+                while running:
+                    for e in pygame.event.get():
+                        if e.type == pygame.QUIT:
+                            pygame.quit()
+                            sys.exit()
+                        if e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE:
+                            running = False
+                        multi_board.handle_input(e)
+                    multi_board.update(clock.tick(60))
+                    pygame.display.update(multi_board.draw(screen))
+                continue
             if selected == 0 or selected == 1:
-                if selected == 0:  # Классический Тетрис
-                    game = Tetris()
-                elif selected == 1:  # Тетрис с примерами
-                    game = TetrisMath(
-                        custom_examples=custom_examples, explosion_threshold=mode_selection.explosion_threshold)
+                game = create_game(selected, mode_selection, custom_examples)
 
                 # Экран ввода имени
                 name_input = NameInputScreen()
@@ -887,96 +1846,85 @@ def main():
                 if not player_name:
                     player_name = "Балбес"
 
-                # Запуск игры
-                fall_time = 0
-                global fall_speed
-                fall_speed = 1000
-
-                # Переменная для отслеживания состояния клавиши вниз
-                fast_fall = False
-
-                # оновной цикл
-                while not game.game_over:
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            pygame.quit()
-                            sys.exit()
-                        if event.type == pygame.KEYDOWN:
-                            if event.key == pygame.K_LEFT:
-                                game.move(-1, 0)
-                            if event.key == pygame.K_RIGHT:
-                                game.move(1, 0)
-                            if event.key == pygame.K_DOWN:
-                                fast_fall = True  # Ускоренное падение
-                            if event.key == pygame.K_UP:
-                                game.rotate()
-                            if event.key == pygame.K_SPACE:  # Пауза на пробел
-                                game.paused = not game.paused
-                        if event.type == pygame.KEYUP:
-                            if event.key == pygame.K_DOWN:
-                                fast_fall = False  # Отключение ускоренного падения
-
-                    if not game.paused:  # Если игра не на паузе
-                        delta_time = clock.tick(60)
-                        fall_time += delta_time
-
-                        # Ускоренное падение, если клавиша вниз нажата
-                        if fast_fall:
-                            fall_speed_fast = 100  # Скорость падения при ускорении
-                            if fall_time >= fall_speed_fast:
-                                game.drop()
-                                fall_time = 0
-                        else:
-                            if fall_time >= fall_speed:
-                                game.drop()
-                                fall_time = 0
-
-                        game.all_sprites.update()
-                        game.explosions.update()
-
-                    game.draw(screen)
-                    if game.paused:  # Экран при нажатии паузы
-                        font = pygame.font.Font(None, 74)
-                        pause_text = font.render("Пауза", True, WHITE)
-                        screen.blit(pause_text, (SCREEN_WIDTH // 2 - pause_text.get_width() // 2, SCREEN_HEIGHT // 2))
-                    pygame.display.flip()
+                # Партии подряд: "Новая игра" на экране Game Over начинает следующую с тем же игроком
+                while True:
+                    # Логика идет фиксированными шагами, отрисовка между шагами интерполируется
+                    simulation = SimulationClock()
+
+                    # Ввод с метками времени, автоповтором сдвига и ускоренным падением.
+                    # Повторы идут по часам симуляции, поэтому чередуются с шагами гравитации
+                    controls = InputHandler(clock=lambda: game.sim_time)
+                    if memory is not None:
+                        memory.watch(game)
+                    session = None
+                    if telemetry is not None:
+                        session = SessionTelemetry(
+                            telemetry, game, "classic" if selected == 0 else "math", player_name)
+
+                    # оновной цикл
+                    while not game.game_over:
+                        # Ожидание кадра до опроса ввода, чтобы нажатия не ждали следующего кадра
+                        elapsed = clock.tick(60)
+                        for event in pygame.event.get():
+                            if event.type == pygame.QUIT:
+                                pygame.quit()
+                                sys.exit()
+                            controls.feed(event)
+                        controls.update(game)
+
+                        for _ in range(simulation.advance(elapsed)):
+                            step_game(game, simulation.tick_ms, controls.soft_dropping)
+                            controls.update(game, now=game.sim_time)
+
+                        interpolate_game(game, simulation.alpha)
+
+                        game.draw(screen)
+                        if game.paused:  # Экран при нажатии паузы
+                            font = get_font(74)
+                            pause_text = font.render("Пауза", True, WHITE)
+                            screen.blit(pause_text, (SCREEN_WIDTH // 2 - pause_text.get_width() // 2, SCREEN_HEIGHT // 2))
+                            latency = controls.latency.summary()
+                            if latency:
+                                latency_text = get_font(28).render(
+                                    f"Задержка ввода: p50 {latency['p50']:.0f} мс, p99 {latency['p99']:.0f} мс",
+                                    True, WHITE)
+                                screen.blit(latency_text, (SCREEN_WIDTH // 2 - latency_text.get_width() // 2,
+                                                           SCREEN_HEIGHT // 2 + 70))
+                        if memory is not None:
+                            memory.draw(screen)
+                        pygame.display.flip()
+                        controls.frame_presented()
+                        if memory is not None:
+                            memory.frame(screen)
+                        if session is not None:
+                            session.frame(elapsed)
 
-                # Сохранение результата
-                save_score(player_name, game.score, game.level, "classic" if selected == 0 else "math")
+                    if session is not None:
+                        session.finish()
 
-                # Экран Game Over
-                if game.game_over:
                     # Сохранение результата
                     save_score(player_name, game.score, game.level, "classic" if selected == 0 else "math")
 
                     # Экран Game Over
                     game_over_screen = GameOverScreen(game.score)
-                    while True:
+                    selected_option = None
+                    while selected_option is None:
                         for event in pygame.event.get():
                             if event.type == pygame.QUIT:
                                 pygame.quit()
                                 sys.exit()
                             selected_option = game_over_screen.handle_input(event)
                             if selected_option is not None:
-                                if selected_option == 0:  # Новая игра
-                                    # Перезапуск игры
-                                    if mode_selection.options[selected] == "Классический Тетрис":
-                                        game = Tetris()
-                                    else:
-                                        game = TetrisMath()
-                                    # Сброс параметров
-                                    fall_speed = 1000
-                                    game_over = False
-                                    break
-                                elif selected_option == 1:  # Главное меню
-                                    break
+                                break
                         else:
                             # Отрисовка экрана Game Over
                             game_over_screen.draw(screen)
                             pygame.display.flip()
                             clock.tick(60)
-                            continue
+                    if selected_option != 0:  # Главное меню
                         break
+                    # Перезапуск игры
+                    game = create_game(selected, mode_selection, custom_examples)
             elif selected == 3:  # Таблица рекордов
                 # Показ таблицы рекордов
                 high_scores = HighScoresScreen()
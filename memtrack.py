@@ -0,0 +1,253 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import pygame
+
+LOG_PATH = "data/memtrack.jsonl"
+REPORT_MS = 5000
+TOP_SITES = 10
+TRACE_FRAMES = 1
+
+# Игровые события, для которых считается память: имя события -> метод игры.
+# Замер включающий: в lock попадает и память, выделенная внутри clear, merge и explosion.
+GAME_EVENTS = {
+    "lock": "lock_piece",
+    "clear": "clear_lines",
+    "merge": "check_merge",
+    "explosion": "check_explosions"
+}
+
+
+def memtrack_enabled():
+    # Как и TETRIS_TELEMETRY, значение "0" или пустая строка означает "выключено"
+    return "--memtrack" in sys.argv[1:] or os.environ.get("TETRIS_MEMTRACK", "0") not in ("", "0")
+
+
+# Поверхности pygame не отслеживаются сборщиком мусора и их пиксели не видны tracemalloc,
+# поэтому живые поверхности ищутся среди ссылок всех отслеживаемых объектов.
+# Словари и кортежи, в которых лежат только поверхности и числа, сборщик тоже не отслеживает,
+# поэтому в них обход спускается отдельно. Подповерхности делят пиксели с родителем и в байты не входят.
+def surface_stats(extra=()):
+    seen = set()
+    count = 0
+    size = 0
+    stack = gc.get_objects()
+    stack.extend(surface for surface in extra if surface is not None)
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, pygame.Surface):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                count += 1
+                if obj.get_parent() is None:
+                    size += obj.get_pitch() * obj.get_height()
+            continue
+        for ref in gc.get_referents(obj):
+            if isinstance(ref, pygame.Surface):
+                stack.append(ref)
+            elif isinstance(ref, (dict, list, tuple)) and not gc.is_tracked(ref) and id(ref) not in seen:
+                seen.add(id(ref))
+                stack.append(ref)
+    return count, size
+
+
+def new_stats():
+    return {"count": 0, "bytes": 0, "max": 0}
+
+
+def add_stats(stats, value):
+    stats["count"] += 1
+    stats["bytes"] += value
+    stats["max"] = max(stats["max"], value)
+
+
+# Замеры памяти по кадрам и игровым событиям, периодический отчет в JSON и сводка на экране.
+# Включается флагом --memtrack или переменной окружения TETRIS_MEMTRACK.
+class MemoryTracker:
+    def __init__(self, log_path=LOG_PATH, report_ms=REPORT_MS, top=TOP_SITES, clock=time.monotonic):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        self.log_path = log_path
+        self.report_ms = report_ms
+        self.top = top
+        self.clock = clock
+        self.filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ]
+        self.baseline = self.take_snapshot()
+        self.last_report = self.clock()
+        self.last_current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.frames = new_stats()
+        self.frame_peak = 0
+        self.events = {event: new_stats() for event in GAME_EVENTS}
+        self.summary = None
+        self.lines = []
+        self.font = None
+        self.rendered = None
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+
+    # Методы событий подменяются только у переданного объекта игры
+    def watch(self, game):
+        for event, name in GAME_EVENTS.items():
+            method = getattr(game, name, None)
+            if method is not None:
+                setattr(game, name, self.wrap(self.events[event], method))
+
+    def wrap(self, stats, method):
+        def measured(*args, **kwargs):
+            before = tracemalloc.get_traced_memory()[0]
+            result = method(*args, **kwargs)
+            add_stats(stats, tracemalloc.get_traced_memory()[0] - before)
+            return result
+        return measured
+
+    # Вызывается раз в кадр: прирост памяти за кадр и пик внутри кадра
+    def frame(self, screen=None):
+        current, peak = tracemalloc.get_traced_memory()
+        add_stats(self.frames, current - self.last_current)
+        self.frame_peak = max(self.frame_peak, peak - self.last_current)
+        tracemalloc.reset_peak()
+        self.last_current = current
+        if (self.clock() - self.last_report) * 1000 >= self.report_ms:
+            self.report(screen)
+
+    def report(self, screen=None):
+        snapshot = self.take_snapshot()
+        sites = snapshot.compare_to(self.baseline, "lineno")[:self.top]
+        self.baseline = snapshot
+        current, _ = tracemalloc.get_traced_memory()
+        count, size = surface_stats((screen,))
+        frames = self.frames["count"] or 1
+        self.summary = {
+            "time": time.time(),
+            "traced": current,
+            "frames": self.frames["count"],
+            "frame_avg": self.frames["bytes"] // frames,
+            "frame_max": self.frames["max"],
+            "frame_peak": self.frame_peak,
+            "events": {event: dict(stats) for event, stats in self.events.items()},
+            "surfaces": count,
+            "surface_bytes": size,
+            "top": [
+                {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in sites
+            ]
+        }
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as log:
+                log.write(json.dumps(self.summary, ensure_ascii=False) + "\n")
+        self.lines = self.summary_lines()
+        self.frames = new_stats()
+        self.frame_peak = 0
+        # Счетчики событий обнуляются на месте: на них ссылаются обертки методов
+        for stats in self.events.values():
+            stats.update(new_stats())
+        self.last_report = self.clock()
+        self.last_current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return self.summary
+
+    def summary_lines(self):
+        s = self.summary
+        lines = [
+            f"Память: {s['traced'] / 1024:.0f} КБ, кадр: {s['frame_avg']:+d} Б (пик {s['frame_peak'] / 1024:.1f} КБ)",
+            f"Поверхности: {s['surfaces']}, {s['surface_bytes'] / 1048576:.1f} МБ",
+            "События: " + ", ".join(f"{event} {stats['count']}x{stats['bytes'] // max(1, stats['count']):+d} Б"
+                                    for event, stats in s["events"].items() if stats["count"])
+        ]
+        if s["top"]:
+            top = s["top"][0]
+            lines.append(f"Рост: {os.path.basename(top['site'])} {top['size_diff'] / 1024:+.1f} КБ")
+        return lines
+
+    # Сводка рисуется из строк последнего отчета, чтобы сама не выделяла память каждый кадр
+    def draw(self, screen):
+        if not self.lines:
+            return
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        if self.rendered is None or self.rendered[0] is not self.lines:
+            self.rendered = (self.lines, [self.font.render(line, True, (255, 255, 0)) for line in self.lines])
+        y = screen.get_height() - 18 * len(self.rendered[1]) - 4
+        for text in self.rendered[1]:
+            screen.blit(text, (4, y))
+            y += 18
+
+
+# Бот для прогона: случайный поворот и столбец, затем сброс фигуры
+def soak_move(game, rng):
+    for _ in range(rng.randrange(4)):
+        game.rotate()
+    target = rng.randrange(game.width)
+    while game.current_piece['x'] < target and game.move(1, 0):
+        pass
+    while game.current_piece['x'] > target and game.move(-1, 0):
+        pass
+    game.hard_drop()
+
+
+# Прогон без окна: много игр подряд с отрисовкой, после каждой игры замер памяти.
+# Рост на игру считается после разогрева (кэши поверхностей и текста заполняются в первых играх).
+def soak(games=20, mode="classic", max_pieces=500, warmup=2, max_growth_kb=64, seed=1, log_path=None):
+    import main
+
+    screen = pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    rng = random.Random(seed)
+    tracker = MemoryTracker(log_path=log_path, report_ms=float("inf"))
+    samples = []
+    for number in range(games):
+        if mode == "math":
+            game = main.TetrisMath(generator=main.ExampleGenerator(seed=seed + number), seed=seed + number)
+        else:
+            game = main.Tetris()
+        tracker.watch(game)
+        for _ in range(max_pieces):
+            if game.game_over:
+                break
+            soak_move(game, rng)
+            main.step_game(game, 50)
+            game.explosions.update()
+            game.draw(screen)
+            tracker.frame(screen)
+        del game
+        gc.collect()
+        summary = tracker.report(screen)
+        total = summary["traced"] + summary["surface_bytes"]
+        samples.append(total)
+        print(f"Игра {number + 1}: память {summary['traced'] / 1024:.0f} КБ, "
+              f"поверхности {summary['surfaces']} ({summary['surface_bytes'] / 1024:.0f} КБ)")
+    # Медиана прироста по играм: разовое заполнение кэша не считается утечкой, а постоянный рост считается
+    deltas = sorted(b - a for a, b in zip(samples[warmup:], samples[warmup + 1:]))
+    if not deltas:
+        return True
+    growth = deltas[len(deltas) // 2] / 1024
+    print(f"Рост на игру: {growth:.1f} КБ (порог {max_growth_kb} КБ)")
+    for site in summary["top"][:5]:
+        print(f"  {site['site']}: {site['size_diff'] / 1024:+.1f} КБ")
+    return growth <= max_growth_kb
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    parser = argparse.ArgumentParser(description="Прогон игр без окна с проверкой роста памяти")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--mode", choices=("classic", "math"), default="classic")
+    parser.add_argument("--pieces", type=int, default=500)
+    parser.add_argument("--max-growth-kb", type=float, default=64)
+    parser.add_argument("--log")
+    args = parser.parse_args()
+    if not soak(args.games, args.mode, args.pieces, max_growth_kb=args.max_growth_kb, log_path=args.log):
+        sys.exit(1)
@@ -0,0 +1,432 @@
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+from collections import deque
+
+# Сервер работает без окна и звука
+if "server" in sys.argv[1:2] or "bots" in sys.argv[1:2]:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+from examples import ExampleGenerator
+from main import (
+    Tetris, TetrisMath, BoardSnapshot, COLORS, GARBAGE_COLOR, WHITE,
+    SCREEN_WIDTH, SCREEN_HEIGHT, step_game
+)
+
+HOST = "127.0.0.1"
+PORT = 8765
+METRICS_PORT = 8766
+TICK_RATE = 30
+TICK_MS = 1000 // TICK_RATE
+MAX_QUEUED_INPUTS = 32
+MAX_WRITE_BUFFER = 256 * 1024
+
+MODE_CLASSIC = 0
+MODE_MATH = 1
+
+ACTION_LEFT = 0
+ACTION_RIGHT = 1
+ACTION_ROTATE = 2
+ACTION_DOWN = 3
+
+FLAG_GAME_OVER = 1
+FLAG_OPPONENT = 2
+
+# Сколько мусорных строк получает соперник за очистку 2, 3 и 4 линий
+GARBAGE_FOR_LINES = {2: 1, 3: 2, 4: 4}
+
+# Формат сообщений: u16 длина, затем тип (1 байт) и поля в сетевом порядке байт.
+# Клиент -> сервер: 'J' режим, соперник (0/1); 'I' действие.
+# Сервер -> клиент: 'W' номер сессии, режим, ширина, высота;
+# 'S' состояние: только изменившиеся клетки, фигура и счет.
+FRAME_HEADER = struct.Struct("!H")
+JOIN = struct.Struct("!cBB")
+INPUT = struct.Struct("!cB")
+WELCOME = struct.Struct("!cIBBH")
+STATE = struct.Struct("!cIIHBBhhBB")
+CELL = struct.Struct("!HHi")
+
+
+def pack_frame(payload):
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+# Кодирование клетки в целое: 0 пусто, в классике номер цвета, в режиме с примерами значение + 1
+def encode_cell(mode, cell):
+    if mode == MODE_MATH:
+        return 0 if cell is None else cell + 1
+    if not cell:
+        return 0
+    if cell == GARBAGE_COLOR:
+        return len(COLORS) + 1
+    return COLORS.index(cell) + 1
+
+
+def decode_cell(mode, code):
+    if mode == MODE_MATH:
+        return None if code == 0 else code - 1
+    if code == 0:
+        return 0
+    if code == len(COLORS) + 1:
+        return GARBAGE_COLOR
+    return COLORS[code - 1]
+
+
+class Session:
+    def __init__(self, session_id, mode, writer):
+        self.id = session_id
+        self.mode = mode
+        self.writer = writer
+        if mode == MODE_MATH:
+            self.game = TetrisMath(headless=True, generator=ExampleGenerator())
+        else:
+            self.game = Tetris(headless=True)
+        self.inputs = deque(maxlen=MAX_QUEUED_INPUTS)
+        self.opponent = None
+        self.pending_garbage = 0
+        self.counted_clears = 0
+        self.sent_version = None
+        self.sent_rows = tuple((None,) * self.game.width for _ in range(self.game.height))
+        self.closed = False
+
+    def rows(self):
+        return self.game.snapshot().rows
+
+    def cleared(self):
+        if self.mode == MODE_MATH:
+            return self.game.exploded
+        return self.game.lines
+
+    def step(self, tick_ms):
+        game = self.game
+        if self.pending_garbage:
+            game.add_garbage(self.pending_garbage)
+            self.pending_garbage = 0
+        while self.inputs and not game.game_over:
+            action = self.inputs.popleft()
+            if action == ACTION_LEFT:
+                game.move(-1, 0)
+            elif action == ACTION_RIGHT:
+                game.move(1, 0)
+            elif action == ACTION_ROTATE:
+                game.rotate()
+            elif action == ACTION_DOWN:
+                game.drop()
+        if game.game_over:
+            return
+        step_game(game, tick_ms)
+
+        # Мусор сопернику за очищенные линии (в режиме с примерами за взорванные кубики)
+        cleared = self.cleared() - self.counted_clears
+        self.counted_clears += cleared
+        if cleared and self.opponent is not None and not self.opponent.closed:
+            if self.mode == MODE_MATH:
+                self.opponent.pending_garbage += cleared
+            else:
+                self.opponent.pending_garbage += GARBAGE_FOR_LINES.get(cleared, 0)
+
+    # Дельта состояния: сравниваются только строки, изменившиеся с прошлой отправки
+    def state_frame(self, tick):
+        game = self.game
+        cells = []
+        if game.board_version != self.sent_version:
+            rows = self.rows()
+            for y, (row, sent_row) in enumerate(zip(rows, self.sent_rows)):
+                if row != sent_row:
+                    for x, (cell, sent_cell) in enumerate(zip(row, sent_row)):
+                        if cell != sent_cell:
+                            cells.append(CELL.pack(x, y, encode_cell(self.mode, cell)))
+            self.sent_rows = rows
+            self.sent_version = game.board_version
+
+        piece = game.current_piece
+        shape = piece['shape'] if piece else ()
+        shape_height = len(shape)
+        shape_width = len(shape[0]) if shape else 0
+        kind = COLORS.index(piece['color']) + 1 if piece and self.mode == MODE_CLASSIC else 0
+        flags = (FLAG_GAME_OVER if game.game_over else 0) | (FLAG_OPPONENT if self.opponent else 0)
+        example = piece.get('example', '').encode("utf-8")[:255] if piece else b''
+        parts = [
+            STATE.pack(b'S', tick, game.score, game.level, flags, kind,
+                       piece['x'] if piece else 0, piece['y'] if piece else 0, shape_width, shape_height),
+            bytes(1 if cell else 0 for row in shape for cell in row),
+            bytes((len(example),)), example,
+            struct.pack("!H", len(cells))
+        ]
+        parts.extend(cells)
+        return pack_frame(b''.join(parts))
+
+
+class Metrics:
+    def __init__(self, window=TICK_RATE * 60):
+        self.tick_times = deque(maxlen=window)
+        self.ticks = 0
+        self.overruns = 0
+        self.bytes_sent = 0
+        self.dropped_clients = 0
+
+    def as_dict(self, server):
+        times = sorted(self.tick_times)
+
+        def percentile(p):
+            return round(times[min(len(times) - 1, int(len(times) * p))], 3) if times else 0
+
+        return {
+            "sessions": len(server.sessions),
+            "waiting": sum(len(queue) for queue in server.waiting.values()),
+            "ticks": self.ticks,
+            "tick_ms_p50": percentile(0.5),
+            "tick_ms_p99": percentile(0.99),
+            "tick_ms_max": round(times[-1], 3) if times else 0,
+            "tick_budget_ms": TICK_MS,
+            "overruns": self.overruns,
+            "bytes_sent": self.bytes_sent,
+            "dropped_clients": self.dropped_clients
+        }
+
+
+# Авторитетный сервер: все сессии обновляются одним циклом с фиксированной частотой тиков
+class GameServer:
+    def __init__(self):
+        self.sessions = {}
+        self.waiting = {MODE_CLASSIC: deque(), MODE_MATH: deque()}
+        self.next_id = 1
+        self.tick = 0
+        self.metrics = Metrics()
+
+    async def handle_client(self, reader, writer):
+        session = None
+        try:
+            payload = await read_frame(reader)
+            if payload[:1] != b'J':
+                return
+            _, mode, versus = JOIN.unpack(payload)
+            mode = MODE_MATH if mode == MODE_MATH else MODE_CLASSIC
+            session = Session(self.next_id, mode, writer)
+            self.next_id += 1
+            self.sessions[session.id] = session
+            writer.write(pack_frame(WELCOME.pack(
+                b'W', session.id, mode, session.game.width, session.game.height)))
+            if versus:
+                self.pair(session)
+            while True:
+                payload = await read_frame(reader)
+                if payload[:1] == b'I':
+                    _, action = INPUT.unpack(payload)
+                    session.inputs.append(action)
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+            pass
+        finally:
+            if session is not None:
+                self.close_session(session)
+            writer.close()
+
+    def pair(self, session):
+        queue = self.waiting[session.mode]
+        while queue and queue[0].closed:
+            queue.popleft()
+        if queue:
+            opponent = queue.popleft()
+            session.opponent = opponent
+            opponent.opponent = session
+        else:
+            queue.append(session)
+
+    def close_session(self, session):
+        session.closed = True
+        self.sessions.pop(session.id, None)
+        if session.opponent is not None:
+            session.opponent.opponent = None
+
+    def run_tick(self):
+        self.tick += 1
+        for session in list(self.sessions.values()):
+            session.step(TICK_MS)
+        for session in list(self.sessions.values()):
+            frame = session.state_frame(self.tick)
+            transport = session.writer.transport
+            # Медленный клиент не должен раздувать память сервера
+            if transport.is_closing() or transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                self.metrics.dropped_clients += 1
+                self.close_session(session)
+                transport.abort()
+                continue
+            session.writer.write(frame)
+            self.metrics.bytes_sent += len(frame)
+
+    async def tick_loop(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            started = time.perf_counter()
+            self.run_tick()
+            elapsed = (time.perf_counter() - started) * 1000
+            self.metrics.ticks += 1
+            self.metrics.tick_times.append(elapsed)
+            next_tick += TICK_MS / 1000
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # Не догоняем пропущенные тики пачкой, а сдвигаем расписание
+                self.metrics.overruns += 1
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def handle_metrics(self, reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        body = json.dumps(self.metrics.as_dict(self)).encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii")
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+    async def serve(self, host=HOST, port=PORT, metrics_port=METRICS_PORT):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        metrics = await asyncio.start_server(self.handle_metrics, host, metrics_port)
+        print(f"Сервер: {host}:{port}, метрики: http://{host}:{metrics_port}/")
+        async with server, metrics:
+            await self.tick_loop()
+
+
+# Тонкий клиент: локальная игра служит только зеркалом состояния сервера и рисуется обычным draw
+class RemoteBoard:
+    def __init__(self, mode, width, height, headless=False):
+        self.mode = mode
+        if mode == MODE_MATH:
+            self.game = TetrisMath(custom_examples=[], headless=headless)
+        else:
+            self.game = Tetris(headless=headless)
+        empty = None if mode == MODE_MATH else 0
+        self.game.restore(BoardSnapshot(tuple((empty,) * width for _ in range(height)), 0, 1, None))
+        self.game.next_piece = None
+        self.tick = 0
+
+    def apply(self, payload):
+        game = self.game
+        (_, self.tick, game.score, game.level, flags, kind,
+         piece_x, piece_y, shape_width, shape_height) = STATE.unpack_from(payload)
+        offset = STATE.size
+        bits = payload[offset:offset + shape_width * shape_height]
+        offset += len(bits)
+        example_length = payload[offset]
+        example = payload[offset + 1:offset + 1 + example_length].decode("utf-8")
+        offset += 1 + example_length
+        (count,) = struct.unpack_from("!H", payload, offset)
+        offset += 2
+        columns = set()
+        for _ in range(count):
+            x, y, code = CELL.unpack_from(payload, offset)
+            offset += CELL.size
+            value = decode_cell(self.mode, code)
+            if self.mode == MODE_MATH:
+                if value is None:
+                    game.clear_cell(x, y)
+                else:
+                    game.set_cell(x, y, value)
+            else:
+                game.grid[y][x] = value
+                game.paint_cell(x, y)
+                columns.add(x)
+        for x in columns:
+            game.profile.rescan(x, game.is_filled)
+        game.game_over = bool(flags & FLAG_GAME_OVER)
+        if shape_width:
+            shape = [list(bits[row * shape_width:(row + 1) * shape_width]) for row in range(shape_height)]
+            if self.mode == MODE_MATH:
+                game.current_piece = {'shape': shape, 'texture': game.cube_texture, 'x': piece_x, 'y': piece_y,
+                                      'example': example, 'answer': None}
+            else:
+                game.current_piece = {'shape': shape, 'color': COLORS[kind - 1], 'x': piece_x, 'y': piece_y}
+        else:
+            game.current_piece = None
+
+
+KEY_ACTIONS = {
+    pygame.K_LEFT: ACTION_LEFT,
+    pygame.K_RIGHT: ACTION_RIGHT,
+    pygame.K_UP: ACTION_ROTATE,
+    pygame.K_DOWN: ACTION_DOWN
+}
+
+
+async def run_client(mode=MODE_CLASSIC, versus=True, host=HOST, port=PORT):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(pack_frame(JOIN.pack(b'J', mode, 1 if versus else 0)))
+    _, session_id, mode, width, height = WELCOME.unpack(await read_frame(reader))
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(f"Тетрис по сети (сессия {session_id})")
+    remote = RemoteBoard(mode, width, height)
+    clock = pygame.time.Clock()
+
+    async def receive():
+        while True:
+            remote.apply(await read_frame(reader))
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while not receiver.done():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                if event.type == pygame.KEYDOWN and event.key in KEY_ACTIONS:
+                    writer.write(pack_frame(INPUT.pack(b'I', KEY_ACTIONS[event.key])))
+            remote.game.draw(screen)
+            if remote.game.game_over:
+                text = pygame.font.Font(None, 74).render("Game Over", True, WHITE)
+                screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, SCREEN_HEIGHT // 2))
+            pygame.display.flip()
+            clock.tick(60)
+            await asyncio.sleep(0)
+    finally:
+        receiver.cancel()
+        writer.close()
+
+
+# Нагрузочная проверка через loopback: count ботов играют случайными нажатиями без окна
+async def run_bots(count, seconds=30, host=HOST, port=PORT):
+    states = []
+
+    async def bot(index):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(pack_frame(JOIN.pack(b'J', index % 2, 1)))
+        _, _, mode, width, height = WELCOME.unpack(await read_frame(reader))
+        remote = RemoteBoard(mode, width, height, headless=True)
+        states.append(remote)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not remote.game.game_over:
+            remote.apply(await read_frame(reader))
+            if random.random() < 0.3:
+                writer.write(pack_frame(INPUT.pack(b'I', random.choice(list(KEY_ACTIONS.values())))))
+        writer.close()
+
+    await asyncio.gather(*(bot(i) for i in range(count)), return_exceptions=True)
+    print(f"Ботов: {len(states)}, закончили игру: {sum(remote.game.game_over for remote in states)}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "client"
+    if command == "server":
+        asyncio.run(GameServer().serve())
+    elif command == "bots":
+        asyncio.run(run_bots(int(sys.argv[2]) if len(sys.argv) > 2 else 100))
+    else:
+        asyncio.run(run_client(MODE_MATH if "math" in sys.argv[2:] else MODE_CLASSIC))
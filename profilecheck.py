@@ -0,0 +1,151 @@
+import argparse
+import os
+import random
+import sys
+
+# Мусор от соперника добавляется раз в GARBAGE_EVERY фигур, снимок с восстановлением раз в RESTORE_EVERY
+GARBAGE_EVERY = 10
+RESTORE_EVERY = 15
+# Доля ходов, выбранных по полю (глубже и без новых дыр): так классические партии доходят до очистки строк.
+# Остальные ходы случайные, с подталкиванием под нависающие блоки
+PLANNED_SHARE = 0.7
+
+
+# Профиль игры должен совпадать с полным пересчетом поля
+def check_profile(game, main):
+    reference = main.ColumnProfile(game.width, game.height)
+    reference.rescan_all(game.is_filled)
+    if reference.tops != game.profile.tops or reference.holes != game.profile.holes:
+        return (f"профиль {game.profile.tops} {game.profile.holes}, "
+                f"пересчет {reference.tops} {reference.holes}")
+    return None
+
+
+# Расстояние падения по профилю сверяется с пошаговой проверкой столкновений
+def check_drop(game):
+    piece = game.current_piece
+    if game.check_collision(piece['shape'], (piece['x'], piece['y'])):
+        return None
+    distance = game.drop_distance()
+    if game.check_collision(piece['shape'], (piece['x'], piece['y'] + distance)) or \
+            not game.check_collision(piece['shape'], (piece['x'], piece['y'] + distance + 1)):
+        return f"падение {distance} для фигуры в ({piece['x']}, {piece['y']})"
+    return None
+
+
+# Верх каждого столбца по самому полю, без профиля
+def column_tops(game):
+    tops = []
+    for x in range(game.width):
+        y = 0
+        while y < game.height and not game.is_filled(x, y):
+            y += 1
+        tops.append(y)
+    return tops
+
+
+# Оценка хода: сколько пустых клеток останется под фигурой и насколько высоко она ляжет
+def placement_cost(shape, x, tops):
+    bottoms = {}
+    for y, row in enumerate(shape):
+        for dx, cell in enumerate(row):
+            if cell:
+                bottoms[dx] = y
+    if x < 0 or x + len(shape[0]) > len(tops):
+        return None
+    land = min(tops[x + dx] - y - 1 for dx, y in bottoms.items())
+    gaps = sum(tops[x + dx] - land - y - 1 for dx, y in bottoms.items())
+    return gaps, -land
+
+
+def planned_move(game, rng):
+    tops = column_tops(game)
+    best = None
+    for turns in range(4):
+        shape = game.current_piece['shape']
+        for x in range(game.width):
+            cost = placement_cost(shape, x, tops)
+            if cost is None:
+                continue
+            # Равные ходы выбираются случайно
+            key = (cost, rng.random())
+            if best is None or key < best[0]:
+                best = (key, turns, x)
+        game.rotate()
+    for _ in range(best[1]):
+        game.rotate()
+    return best[2]
+
+
+def random_move(game, rng):
+    for _ in range(rng.randint(0, 3)):
+        game.rotate()
+    return rng.randrange(game.width)
+
+
+def make_move(game, rng):
+    target = planned_move(game, rng) if rng.random() < PLANNED_SHARE else random_move(game, rng)
+    while game.current_piece['x'] < target and game.move(1, 0):
+        pass
+    while game.current_piece['x'] > target and game.move(-1, 0):
+        pass
+    if rng.random() >= PLANNED_SHARE:
+        for _ in range(rng.randint(0, 6)):
+            game.move(0, 1)
+        game.move(rng.choice((-1, 1)), 0)
+
+
+def new_game(main, mode, seed):
+    if mode == "math":
+        return main.TetrisMath(explosion_threshold=100, headless=True,
+                               generator=main.ExampleGenerator(seed=seed), seed=seed)
+    return main.Tetris(headless=True, seed=seed)
+
+
+# Партии без окна со случайными ходами, мусором и восстановлением из снимков, всего pieces фигур:
+# после проигрыша начинается новая партия. Возвращает описание первого расхождения или None
+def check_game(main, mode, seed, pieces=300):
+    rng = random.Random(seed)
+    game = new_game(main, mode, seed)
+    for number in range(1, pieces + 1):
+        if game.game_over:
+            game = new_game(main, mode, rng.randrange(1 << 30))
+        make_move(game, rng)
+        error = check_drop(game)
+        if error is None:
+            game.hard_drop()
+            if number % GARBAGE_EVERY == 0:
+                game.add_garbage(rng.randint(1, 3))
+            if number % RESTORE_EVERY == 0:
+                game.restore(game.snapshot(), render=False)
+            error = check_profile(game, main)
+        if error is not None:
+            return f"{mode}, seed {seed}, фигура {number}: {error}"
+    return None
+
+
+def run(seeds=30, modes=("classic", "math"), pieces=300):
+    import main
+
+    failures = []
+    for seed in range(seeds):
+        for mode in modes:
+            error = check_game(main, mode, seed, pieces)
+            if error is not None:
+                failures.append(error)
+                print(error)
+    print(f"Партий: {seeds * len(modes)}, расхождений: {len(failures)}")
+    return not failures
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    parser = argparse.ArgumentParser(description="Сверка профиля столбцов с полным пересчетом поля на случайных партиях")
+    parser.add_argument("--seeds", type=int, default=30)
+    parser.add_argument("--mode", choices=("classic", "math", "all"), default="all")
+    parser.add_argument("--pieces", type=int, default=300)
+    args = parser.parse_args()
+    modes = ("classic", "math") if args.mode == "all" else (args.mode,)
+    if not run(args.seeds, modes, args.pieces):
+        sys.exit(1)
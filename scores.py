@@ -0,0 +1,286 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import uuid
+from datetime import datetime
+
+DB_PATH = "data/tetris_scores.db"
+FIELDS = ("player_name", "score", "level", "date", "mode", "kiosk", "source_id")
+BATCH_SIZE = 1000
+
+# Дата хранится как ДД.ММ.ГГГГ, для сортировки переводим в ГГГГ-ММ-ДД
+SORTABLE_DATE = "substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)"
+
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    init_db(conn)
+    return conn
+
+
+# Инициализация базы данных
+def init_db(conn=None):
+    own = conn is None
+    if own:
+        conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            player_name TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            mode TEXT NOT NULL
+        )
+    """)
+    # Индекс для поиска дубликатов при импорте и для отчетов по игрокам
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS scores_dedup
+        ON scores (player_name, score, level, date, mode)
+    """)
+    # Источник импортированной записи: киоск и id записи в его базе. У своих записей пусто
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scores)")}
+    if "kiosk" not in columns:
+        cursor.execute("ALTER TABLE scores ADD COLUMN kiosk TEXT")
+        cursor.execute("ALTER TABLE scores ADD COLUMN source_id INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS scores_source ON scores (kiosk, source_id)")
+    # Идентификатор этого киоска создается один раз при первой инициализации базы
+    cursor.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('kiosk', ?)", (uuid.uuid4().hex[:12],))
+    conn.commit()
+    if own:
+        conn.close()
+
+
+# Сохранение результатов в таблицу лидеров
+def save_score(player_name, score, level, mode):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO scores (player_name, score, level, date, mode)
+        VALUES (?, ?, ?, ?, ?)
+    """, (player_name, score, level, datetime.now().strftime("%d.%m.%Y"), mode))
+    conn.commit()
+    conn.close()
+
+
+def top_scores(limit=10, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT player_name, score, level, date FROM scores ORDER BY score DESC LIMIT ?", (limit,))
+    scores = cursor.fetchall()
+    conn.close()
+    return scores
+
+
+def kiosk_id(conn):
+    return conn.execute("SELECT value FROM settings WHERE key = 'kiosk'").fetchone()[0]
+
+
+# Потоковая выгрузка: строки читаются курсором порциями, память не зависит от размера таблицы.
+# Каждая строка выгружается с ключом источника (киоск, id), по нему импорт отсеивает повторы
+def iter_scores(conn, mode=None):
+    query = """
+        SELECT player_name, score, level, date, mode, COALESCE(kiosk, ?), COALESCE(source_id, id)
+        FROM scores
+    """
+    params = (kiosk_id(conn),)
+    if mode:
+        query += " WHERE mode = ?"
+        params += (mode,)
+    cursor = conn.execute(query + " ORDER BY id", params)
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(FIELDS, row))
+
+
+def export_scores(conn, out, fmt="csv", mode=None):
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in iter_scores(conn, mode):
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in iter_scores(conn, mode):
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+# Битая строка JSONL отдается как None и считается ошибочной, разбор продолжается
+def read_dump(f, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+
+def clean_row(row):
+    try:
+        name = str(row["player_name"]).strip()
+        score = int(row["score"])
+        level = int(row["level"])
+        date = str(row["date"]).strip()
+        mode = str(row["mode"]).strip()
+        datetime.strptime(date, "%d.%m.%Y")
+        # Старые выгрузки без ключа источника тоже принимаются
+        kiosk = str(row.get("kiosk") or "").strip() or None
+        source_id = int(row["source_id"]) if kiosk and row.get("source_id") not in (None, "") else None
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not name or not mode:
+        return None
+    return name, score, level, date, mode, kiosk if source_id is not None else None, source_id
+
+
+# Импорт дампов с других киосков пакетными транзакциями. Повтор определяется по ключу источника
+# (киоск, id записи там), поэтому одинаковые по всем полям разные игры не теряются.
+# Свои записи, вернувшиеся из выгрузки, совпадают по id. Только у строк старых выгрузок без ключа
+# повтором считается полное совпадение полей.
+def import_scores(conn, f, fmt="csv"):
+    stats = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0}
+    batch = []
+    local = kiosk_id(conn)
+
+    def flush():
+        before = conn.total_changes
+        with conn:
+            conn.executemany("""
+                INSERT INTO scores (player_name, score, level, date, mode, kiosk, source_id)
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7
+                WHERE CASE
+                    WHEN ?6 IS NULL THEN NOT EXISTS (
+                        SELECT 1 FROM scores
+                        WHERE player_name = ?1 AND score = ?2 AND level = ?3 AND date = ?4 AND mode = ?5
+                    )
+                    ELSE NOT EXISTS (SELECT 1 FROM scores WHERE kiosk = ?6 AND source_id = ?7)
+                         AND NOT (?6 = ?8 AND EXISTS (SELECT 1 FROM scores WHERE id = ?7 AND kiosk IS NULL))
+                END
+            """, [row + (local,) for row in batch])
+        inserted = conn.total_changes - before
+        stats["inserted"] += inserted
+        stats["duplicates"] += len(batch) - inserted
+        batch.clear()
+
+    for row in read_dump(f, fmt):
+        stats["read"] += 1
+        cleaned = clean_row(row) if isinstance(row, dict) else None
+        if cleaned is None:
+            stats["invalid"] += 1
+            continue
+        batch.append(cleaned)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+# Отчеты считаются в SQL, в Python приходят только итоговые строки
+def mode_percentiles(conn):
+    return conn.execute("""
+        WITH ranked AS (
+            SELECT mode, score,
+                   ROW_NUMBER() OVER (PARTITION BY mode ORDER BY score) AS rn,
+                   COUNT(*) OVER (PARTITION BY mode) AS n
+            FROM scores
+        )
+        SELECT mode, MAX(n) AS games,
+               MIN(CASE WHEN rn >= 0.5 * n THEN score END) AS p50,
+               MIN(CASE WHEN rn >= 0.9 * n THEN score END) AS p90,
+               MIN(CASE WHEN rn >= 0.99 * n THEN score END) AS p99,
+               MAX(score) AS best
+        FROM ranked
+        GROUP BY mode
+        ORDER BY mode
+    """).fetchall()
+
+
+def player_history(conn, player_name):
+    return conn.execute(f"""
+        SELECT {SORTABLE_DATE} AS day, mode, score, level,
+               MAX(score) OVER (PARTITION BY mode ORDER BY id) AS best_so_far
+        FROM scores
+        WHERE player_name = ?
+        ORDER BY id
+    """, (player_name,)).fetchall()
+
+
+def daily_counts(conn):
+    return conn.execute(f"""
+        SELECT {SORTABLE_DATE} AS day, mode, COUNT(*) AS games, MAX(score) AS best, CAST(AVG(score) AS INTEGER) AS average
+        FROM scores
+        GROUP BY day, mode
+        ORDER BY day, mode
+    """).fetchall()
+
+
+def print_rows(header, rows):
+    print("\t".join(header))
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка, загрузка и отчеты по таблице рекордов")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    export_parser.add_argument("--mode")
+    export_parser.add_argument("-o", "--output")
+
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+
+    report_parser = commands.add_parser("report")
+    report_parser.add_argument("kind", choices=("percentiles", "player", "daily"))
+    report_parser.add_argument("player", nargs="?")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    try:
+        if args.command == "export":
+            if args.output:
+                with open(args.output, "w", encoding="utf-8", newline="") as out:
+                    count = export_scores(conn, out, args.format, args.mode)
+            else:
+                count = export_scores(conn, sys.stdout, args.format, args.mode)
+            print(f"Выгружено записей: {count}", file=sys.stderr)
+        elif args.command == "import":
+            for path in args.files:
+                fmt = args.format or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+                with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                    stats = import_scores(conn, f, fmt)
+                print(f"{path}: прочитано {stats['read']}, добавлено {stats['inserted']}, "
+                      f"дубликатов {stats['duplicates']}, с ошибками {stats['invalid']}")
+        elif args.kind == "percentiles":
+            print_rows(("mode", "games", "p50", "p90", "p99", "best"), mode_percentiles(conn))
+        elif args.kind == "player":
+            if not args.player:
+                parser.error("укажите имя игрока")
+            print_rows(("day", "mode", "score", "level", "best_so_far"), player_history(conn, args.player))
+        else:
+            print_rows(("day", "mode", "games", "best", "average"), daily_counts(conn))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from scores import print_rows
+
+TELEMETRY_DB = "data/telemetry.db"
+RING_SIZE = 10000
+BATCH_SIZE = 500
+FLUSH_MS = 2000
+FRAME_WINDOW = 600
+# События начала и конца сессии пишутся даже при полном буфере, иначе сессия выглядит незаконченной
+ALWAYS_KEPT = ("start", "end")
+
+# Методы игры, вызовы которых записываются как события
+WATCHED = ("new_piece", "clear_lines", "check_merge", "check_explosions")
+
+
+def telemetry_enabled():
+    return "--no-telemetry" not in sys.argv[1:] and os.environ.get("TETRIS_TELEMETRY", "1") != "0"
+
+
+def init_telemetry(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS telemetry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session TEXT NOT NULL,
+            time_ms INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            level INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            data TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS telemetry_session ON telemetry (session, kind)")
+    conn.commit()
+
+
+# Запись событий с игрового потока только кладет кортеж в кольцевой буфер.
+# Фоновый поток раз в FLUSH_MS (или раньше, если набралась порция) пишет буфер в SQLite
+# пакетными транзакциями. Если буфер полон, новые события отбрасываются и считаются в dropped,
+# а сам счетчик потерь записывает фоновый поток отдельной строкой, мимо буфера.
+# dropped увеличивает только игровой поток, failed (порции, не записанные из-за ошибки) только фоновый,
+# поэтому прибавления из двух потоков не теряются без блокировки.
+class Telemetry:
+    def __init__(self, db_path=TELEMETRY_DB, capacity=RING_SIZE, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.buffer = deque()
+        self.dropped = 0
+        self.failed = 0
+        self.saved_dropped = 0
+        self.written = 0
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, session, kind, level=0, value=0, data=None):
+        if len(self.buffer) >= self.capacity and kind not in ALWAYS_KEPT:
+            self.dropped += 1
+            return
+        self.buffer.append((session, int(time.time() * 1000), kind, level, value, data))
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path)
+        init_telemetry(conn)
+        while True:
+            self.wakeup.wait(self.flush_ms / 1000)
+            self.wakeup.clear()
+            self.flush(conn)
+            if self.stopping:
+                break
+        conn.close()
+
+    def flush(self, conn):
+        while self.buffer:
+            batch = []
+            while self.buffer and len(batch) < self.batch_size:
+                batch.append(self.buffer.popleft())
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO telemetry (session, time_ms, kind, level, value, data)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, batch)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                self.failed += len(batch)
+                print(f"Ошибка записи телеметрии: {e}")
+        self.save_dropped(conn)
+
+    def lost(self):
+        return self.dropped + self.failed
+
+    def save_dropped(self, conn):
+        dropped = self.lost()
+        if dropped == self.saved_dropped:
+            return
+        try:
+            with conn:
+                conn.execute("""
+                    INSERT INTO telemetry (session, time_ms, kind, level, value)
+                    VALUES ('', ?, 'dropped', 0, ?)
+                """, (int(time.time() * 1000), dropped - self.saved_dropped))
+            self.saved_dropped = dropped
+        except sqlite3.Error as e:
+            print(f"Ошибка записи телеметрии: {e}")
+
+    def close(self):
+        if self.stopping:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(5)
+
+
+# События одной игры. Методы игры оборачиваются только у переданного объекта,
+# уровень, пауза и время кадров проверяются раз в кадр в frame().
+class SessionTelemetry:
+    def __init__(self, telemetry, game, mode, player=None):
+        self.telemetry = telemetry
+        self.game = game
+        self.id = uuid.uuid4().hex
+        self.started = time.monotonic()
+        self.dropped_before = telemetry.lost()
+        self.level = game.level
+        self.level_started = game.sim_time
+        self.paused = False
+        self.frame_times = []
+        self.finished = False
+        self.record("start", data=json.dumps(
+            {"mode": mode, "board": game.board.name, "player": player}, ensure_ascii=False))
+        for name in WATCHED:
+            method = getattr(game, name, None)
+            if method is not None:
+                setattr(game, name, getattr(self, "watch_" + name)(method))
+        # Первая фигура создается еще в конструкторе игры
+        if game.current_piece is not None:
+            self.record("piece")
+
+    def record(self, kind, value=0, data=None):
+        self.telemetry.record(self.id, kind, self.game.level, value, data)
+
+    def watch_new_piece(self, method):
+        def new_piece(*args, **kwargs):
+            result = method(*args, **kwargs)
+            self.record("piece")
+            return result
+        return new_piece
+
+    def watch_clear_lines(self, method):
+        def clear_lines(*args, **kwargs):
+            before = self.game.lines
+            result = method(*args, **kwargs)
+            if self.game.lines > before:
+                self.record("lines", self.game.lines - before)
+            return result
+        return clear_lines
+
+    # Каждое слияние убирает с поля один кубик
+    def watch_check_merge(self, method):
+        def check_merge(*args, **kwargs):
+            before = self.game.count_blocks()
+            result = method(*args, **kwargs)
+            merged = before - self.game.count_blocks()
+            if merged:
+                self.record("merge", merged)
+            return result
+        return check_merge
+
+    def watch_check_explosions(self, method):
+        def check_explosions(*args, **kwargs):
+            before = self.game.exploded
+            result = method(*args, **kwargs)
+            if self.game.exploded > before:
+                self.record("explosion", self.game.exploded - before)
+            return result
+        return check_explosions
+
+    def frame(self, elapsed_ms):
+        game = self.game
+        self.frame_times.append(elapsed_ms)
+        if len(self.frame_times) >= FRAME_WINDOW:
+            self.frame_summary()
+        if game.paused != self.paused:
+            self.paused = game.paused
+            if self.paused:
+                self.record("pause")
+        if game.level != self.level:
+            self.level_time()
+            self.level = game.level
+
+    # Время на уровне считается по часам симуляции, паузы в него не входят
+    def level_time(self):
+        self.telemetry.record(self.id, "level_time", self.level, self.game.sim_time - self.level_started)
+        self.level_started = self.game.sim_time
+
+    def frame_summary(self):
+        if not self.frame_times:
+            return
+        values = sorted(self.frame_times)
+        self.record("frames", len(values), json.dumps({
+            "p50": values[len(values) // 2],
+            "p99": values[min(len(values) - 1, len(values) * 99 // 100)],
+            "max": values[-1]
+        }))
+        self.frame_times.clear()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.frame_summary()
+        self.level_time()
+        self.record("end", self.game.score, json.dumps({
+            "seconds": round(time.monotonic() - self.started, 1),
+            "dropped": self.telemetry.lost() - self.dropped_before
+        }))
+
+
+# Сводка по всем сессиям, агрегаты считаются в SQL
+def session_report(conn):
+    return conn.execute("""
+        WITH sessions AS (
+            SELECT session,
+                   MAX(CASE WHEN kind = 'start' THEN json_extract(data, '$.mode') END) AS mode,
+                   MAX(CASE WHEN kind = 'end' THEN json_extract(data, '$.seconds') END) AS seconds,
+                   MAX(CASE WHEN kind = 'end' THEN value END) AS score,
+                   MAX(level) AS level,
+                   SUM(kind = 'piece') AS pieces,
+                   SUM(CASE WHEN kind = 'lines' THEN value ELSE 0 END) AS lines,
+                   SUM(CASE WHEN kind = 'merge' THEN value ELSE 0 END) AS merges,
+                   SUM(CASE WHEN kind = 'explosion' THEN value ELSE 0 END) AS explosions,
+                   SUM(kind = 'pause') AS pauses
+            FROM telemetry
+            WHERE kind != 'dropped'
+            GROUP BY session
+        )
+        SELECT mode, COUNT(*) AS sessions, COUNT(seconds) AS finished,
+               ROUND(AVG(seconds), 1) AS avg_seconds, ROUND(AVG(score)) AS avg_score, MAX(level) AS max_level,
+               ROUND(AVG(pieces), 1) AS pieces, ROUND(AVG(lines), 1) AS lines, ROUND(AVG(merges), 1) AS merges,
+               ROUND(AVG(explosions), 1) AS explosions, ROUND(AVG(pauses), 2) AS pauses
+        FROM sessions
+        GROUP BY mode
+        ORDER BY mode
+    """).fetchall()
+
+
+def level_report(conn):
+    return conn.execute("""
+        SELECT level, COUNT(DISTINCT session) AS sessions,
+               ROUND(AVG(value) / 1000.0, 1) AS avg_seconds,
+               ROUND(MIN(value) / 1000.0, 1) AS min_seconds,
+               ROUND(MAX(value) / 1000.0, 1) AS max_seconds
+        FROM telemetry
+        WHERE kind = 'level_time'
+        GROUP BY level
+        ORDER BY level
+    """).fetchall()
+
+
+# Кадры по режимам: средние по окнам перцентили и худший кадр
+def frame_report(conn):
+    return conn.execute("""
+        SELECT s.mode, SUM(f.value) AS frames,
+               ROUND(AVG(json_extract(f.data, '$.p50')), 1) AS p50,
+               ROUND(AVG(json_extract(f.data, '$.p99')), 1) AS p99,
+               MAX(json_extract(f.data, '$.max')) AS worst
+        FROM telemetry f
+        JOIN (SELECT session, json_extract(data, '$.mode') AS mode FROM telemetry WHERE kind = 'start') s
+          ON s.session = f.session
+        WHERE f.kind = 'frames'
+        GROUP BY s.mode
+        ORDER BY s.mode
+    """).fetchall()
+
+
+def dropped_events(conn):
+    return conn.execute("""
+        SELECT COALESCE(SUM(value), 0) FROM telemetry WHERE kind = 'dropped'
+    """).fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчеты по телеметрии игровых сессий")
+    parser.add_argument("--db", default=TELEMETRY_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("report")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        init_telemetry(conn)
+        print_rows(("mode", "sessions", "finished", "avg_seconds", "avg_score", "max_level",
+                    "pieces", "lines", "merges", "explosions", "pauses"), session_report(conn))
+        print()
+        print_rows(("level", "sessions", "avg_seconds", "min_seconds", "max_seconds"), level_report(conn))
+        print()
+        print_rows(("mode", "frames", "p50_ms", "p99_ms", "worst_ms"), frame_report(conn))
+        print()
+        print(f"Потеряно событий: {dropped_events(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()